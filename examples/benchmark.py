@@ -24,7 +24,7 @@ import json
 import coloredlogs
 import logging
 import matplotlib
-from statdp import detect_counterexample, ONE_DIFFER, ALL_DIFFER
+from statdp import detect_counterexample, ONE_DIFFER, ALL_DIFFER, ExecutionOptions, ResultStore
 from statdp.algorithms import *
 
 # switch matplotlib backend for running in background
@@ -91,6 +91,8 @@ def main():
              (SVT, {'N': 1, 'T': 0.5}),
              (iSVT1, {'T': 1, 'N': 1}), (iSVT2, {'T': 1, 'N': 1}), (iSVT3, {'T': 1, 'N': 1}), (iSVT4, {'T': 1, 'N': 1})]
 
+    # each result is written as it completes, so an interrupted run resumes from where it stopped
+    store = ResultStore('./results.jsonl')
     for i, (algorithm, kwargs) in enumerate(tasks):
         start_time = time.time()
         results = {}
@@ -98,7 +100,8 @@ def main():
             kwargs['epsilon'] = privacy_budget
             sensitivity = ONE_DIFFER if 'histogram' in algorithm.__name__ else ALL_DIFFER
             results[privacy_budget] = detect_counterexample(
-                algorithm, tuple(x / 10.0 for x in range(1, 34, 1)), kwargs, sensitivity=sensitivity)
+                algorithm, tuple(x / 10.0 for x in range(1, 34, 1)), kwargs, sensitivity=sensitivity,
+                execution=ExecutionOptions(store=store))
 
         plot_result(r'Test $\epsilon$', 'P Value',
                     results, algorithm.__name__.replace('_', ' ').title(), algorithm.__name__ + '.pdf')
@@ -0,0 +1,300 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+""" Microbenchmarks of the hot paths of statdp.
+
+    python microbenchmark.py run -o baseline.json
+    # ... change statdp ...
+    python microbenchmark.py run -o current.json
+    python microbenchmark.py compare baseline.json current.json --threshold 0.1
+"""
+import argparse
+import functools
+import json
+import logging
+import multiprocessing as mp
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import scipy
+from scipy.stats import hypergeom
+
+import statdp._hypergeom
+from statdp import Session, select_event
+from statdp.algorithms import *
+from statdp.core import _count_events, is_batched, run_algorithm
+from statdp.generators import generate_databases
+from statdp.hypotest import test_statistics
+from statdp.search_spaces import densest, intervals, log_tails, quantiles
+
+logger = logging.getLogger(__name__)
+
+# (algorithm, extra kwargs, the event to count) of the algorithms to measure the sampling rate of
+ALGORITHMS = (
+    (noisy_max_v1a, {}, (0, )),
+    (noisy_max_v1a_batched, {}, (0, )),
+    (histogram, {}, ((-float('inf'), 1.0), )),
+    (histogram_batched, {}, ((-float('inf'), 1.0), )),
+    (SVT, {'N': 1, 'T': 0.5}, (0, )),
+    (SVT_batched, {'N': 1, 'T': 0.5}, (0, )),
+    (iSVT4, {'N': 1, 'T': 1}, (0, (-float('inf'), 1.0))),
+    (iSVT4_batched, {'N': 1, 'T': 1}, (0, (-float('inf'), 1.0))),
+)
+
+
+def measure(func, repeat, min_seconds=0.2):
+    """ Time func() like timeit: the number of calls per measurement is raised until it takes at least
+    :min_seconds:, and the best of :repeat: measurements is reported.
+    :return: The seconds per call.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_seconds / elapsed) + 1)
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def _result(name, params, seconds, units=1, unit='call'):
+    # one benchmark result, rate is the units (e.g., samples) processed per second
+    logger.info('{} {} | {:.3e} s | {:.3e} {}/s'.format(name, params, seconds, units / seconds, unit))
+    return {'name': name, 'params': params, 'seconds': seconds, 'rate': units / seconds, 'unit': unit}
+
+
+def bench_run_algorithm(iterations, queries, repeat):
+    for algorithm, kwargs, event in ALGORITHMS:
+        d1, d2 = [1] * queries, [0] * queries
+        kwargs = dict(kwargs, epsilon=0.5)
+        # the scalar algorithms are slow, measure them on fewer iterations
+        local_iterations = iterations if is_batched(algorithm) else max(1, iterations // 100)
+        seconds = measure(lambda: run_algorithm(algorithm, d1, d2, kwargs, event, local_iterations), repeat)
+        # each iteration runs the algorithm on both databases
+        yield _result('run_algorithm', {'algorithm': algorithm.__name__, 'iterations': local_iterations,
+                                        'queries': queries}, seconds, 2 * local_iterations, 'sample')
+
+
+def bench_count_events(iterations, events, repeat):
+    rng = np.random.default_rng(0)
+    categorical = (rng.integers(0, 10, iterations), rng.integers(0, 10, iterations))
+    numerical = (rng.laplace(size=iterations), rng.laplace(size=iterations))
+    thresholds = tuple((-float('inf'), alpha) for alpha in np.linspace(-2, 2, events))
+    for name, result_d1, result_d2, search_space in (
+            ('numerical', (numerical[0], ), (numerical[1], ), (thresholds, )),
+            ('categorical x numerical', (categorical[0], numerical[0]), (categorical[1], numerical[1]),
+             (tuple(range(10)), thresholds))):
+        seconds = measure(lambda: _count_events(result_d1, result_d2, search_space), repeat)
+        yield _result('count_events', {'output': name, 'iterations': iterations, 'events': events}, seconds,
+                      2 * iterations, 'sample')
+
+
+def bench_search_space(iterations, repeat):
+    values = np.sort(np.random.default_rng(0).laplace(size=2 * iterations))
+    for strategy in (densest, quantiles, intervals, log_tails):
+        seconds = measure(lambda: strategy(values), repeat)
+        yield _result('search_space', {'strategy': strategy.__name__, 'iterations': iterations}, seconds,
+                      2 * iterations, 'sample')
+
+
+def _scalar_test_statistics(cx, cy, epsilon, iterations):
+    # the original p-value computation, one hypergeometric cdf call per binomial sample
+    samples = np.random.binomial(cx, 1.0 / (np.exp(epsilon)), 200)
+    cdf = statdp._hypergeom.get_cdf()
+    return np.mean([1 - cdf(int(x) - 1, 2 * iterations, iterations, int(x) + cy) for x in samples])
+
+
+def _scipy_test_statistics(cx, cy, epsilon, iterations):
+    # a single vectorized call of scipy's hypergeometric survival function
+    samples = np.random.binomial(cx, 1.0 / (np.exp(epsilon)), 200)
+    return hypergeom.sf(samples - 1, 2 * iterations, iterations, samples + cy).mean()
+
+
+def bench_test_statistics(iterations, repeat):
+    cx, cy = int(0.3 * iterations), int(0.2 * iterations)
+    backends = [('exact', test_statistics), ('sf_many', functools.partial(test_statistics, exact=False)),
+                ('scipy', _scipy_test_statistics)]
+    backends.append(('gsl' if statdp._hypergeom.uses_gsl() else 'scipy scalar', _scalar_test_statistics))
+    for backend, func in backends:
+        seconds = measure(lambda: func(cx, cy, 0.5, iterations), repeat)
+        yield _result('test_statistics', {'backend': backend, 'iterations': iterations}, seconds)
+
+
+def bench_select_event(iterations, queries, cores, repeat):
+    algorithm, kwargs = SVT_batched, {'epsilon': 0.5, 'N': 1, 'T': 0.5}
+    input_list = generate_databases(algorithm, queries, kwargs)
+    session = Session(cores) if cores != 1 else None
+    try:
+        seconds = measure(lambda: select_event(algorithm, input_list, 0.5, iterations, process_pool=session,
+                                               quiet=True), repeat)
+    finally:
+        if session is not None:
+            session.close()
+    yield _result('select_event', {'algorithm': algorithm.__name__, 'iterations': iterations, 'queries': queries,
+                                   'cores': cores}, seconds, 2 * iterations * len(input_list), 'sample')
+
+
+def _start_pool(cores):
+    # start the pool and wait until all workers are up
+    pool = mp.Pool(cores)
+    pool.map(abs, range(cores))
+    pool.close()
+    pool.join()
+
+
+def _start_session(cores):
+    with Session(cores) as session:
+        list(session.imap_unordered(abs, range(cores)))
+
+
+def bench_pool_startup(cores, repeat):
+    for name, func in (('multiprocessing.Pool', _start_pool), ('statdp.Session', _start_session)):
+        seconds = measure(lambda: func(cores), repeat, min_seconds=0)
+        yield _result('pool_startup', {'pool': name, 'cores': cores}, seconds)
+
+
+def _import_statdp():
+    # import statdp in a fresh interpreter
+    subprocess.run([sys.executable, '-c', 'import statdp'], check=True)
+
+
+# start a Session with spawned workers in a fresh interpreter, which unlike the forked workers import statdp from
+# scratch, the script is given by -c so that the workers do not re-import this module
+_SPAWN_SESSION = """
+import multiprocessing as mp
+if __name__ == '__main__':
+    import statdp
+    mp.set_start_method('spawn')
+    with statdp.Session({0}) as session:
+        list(session.imap_unordered(abs, range({0})))
+"""
+
+
+def _spawn_session(cores):
+    subprocess.run([sys.executable, '-c', _SPAWN_SESSION.format(cores)], check=True)
+
+
+def bench_import(cores, repeat):
+    yield _result('import', {'cold': True}, measure(_import_statdp, repeat, min_seconds=0))
+    yield _result('pool_startup', {'pool': 'spawned statdp.Session', 'cores': cores},
+                  measure(lambda: _spawn_session(cores), repeat, min_seconds=0))
+
+
+def run(arguments):
+    results = []
+    for iterations in arguments.iterations:
+        for queries in arguments.queries:
+            results.extend(bench_run_algorithm(iterations, queries, arguments.repeat))
+        for events in arguments.events:
+            results.extend(bench_count_events(iterations, events, arguments.repeat))
+        results.extend(bench_search_space(iterations, arguments.repeat))
+        results.extend(bench_test_statistics(iterations, arguments.repeat))
+        for queries in arguments.queries:
+            for cores in arguments.cores:
+                results.extend(bench_select_event(iterations, queries, cores, arguments.repeat))
+    for cores in arguments.cores:
+        results.extend(bench_pool_startup(cores, arguments.repeat))
+    results.extend(bench_import(max(arguments.cores), arguments.repeat))
+
+    report = {
+        'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                 'platform': platform.platform(), 'processor': platform.processor(), 'cpu_count': mp.cpu_count(),
+                 'numpy': np.__version__, 'scipy': scipy.__version__, 'gsl': statdp._hypergeom.uses_gsl()},
+        'results': results
+    }
+    with open(arguments.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info('results are written to {}'.format(arguments.output))
+
+
+def _key(result):
+    return result['name'], json.dumps(result['params'], sort_keys=True)
+
+
+def compare(baseline, current, threshold):
+    """ Compare the benchmark results in two reports.
+    :return: list of (name, params, baseline seconds, current seconds, change, regressed), where change is the relative
+    change of the time, and regressed is whether it is slower by more than :threshold:.
+    """
+    baseline = {_key(result): result for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        key = _key(result)
+        if key not in baseline:
+            continue
+        before, after = baseline[key]['seconds'], result['seconds']
+        change = after / before - 1
+        rows.append((key[0], key[1], before, after, change, change > threshold))
+    return rows
+
+
+def compare_command(arguments):
+    with open(arguments.baseline) as f:
+        baseline = json.load(f)
+    with open(arguments.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, arguments.threshold)
+    for name, params, before, after, change, regressed in rows:
+        print('{:16} {:80} {:.3e} -> {:.3e} s ({:+7.1%}){}'
+              .format(name, params, before, after, change, '  REGRESSION' if regressed else ''))
+    regressions = sum(regressed for *_, regressed in rows)
+    print('{} benchmarks compared, {} regressions beyond {:.0%}'.format(len(rows), regressions, arguments.threshold))
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmarks of statdp.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    run_parser = subparsers.add_parser('run', help='run the benchmarks and write the results to a JSON file')
+    run_parser.add_argument('-o', '--output', default='microbenchmark.json', help='the output JSON file')
+    run_parser.add_argument('--iterations', type=int, nargs='+', default=[100000])
+    run_parser.add_argument('--queries', type=int, nargs='+', default=[5, 100])
+    run_parser.add_argument('--events', type=int, nargs='+', default=[10, 1000])
+    run_parser.add_argument('--cores', type=int, nargs='+', default=[1, mp.cpu_count()])
+    run_parser.add_argument('--repeat', type=int, default=3, help='report the best of the repeated measurements')
+    compare_parser = subparsers.add_parser('compare', help='compare two results and flag the regressions')
+    compare_parser.add_argument('baseline', help='the JSON file of the baseline results')
+    compare_parser.add_argument('current', help='the JSON file of the current results')
+    compare_parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                                help='flag the benchmarks slower than the baseline by more than this fraction')
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if arguments.command == 'run':
+        run(arguments)
+    else:
+        sys.exit(compare_command(arguments))
+
+
+if __name__ == '__main__':
+    main()
@@ -25,7 +25,7 @@ setup(
     ],
     keywords='Differential Privacy, Hypothesis Test, Statistics',
     packages=find_packages(exclude=['tests']),
-    install_requires=['numpy', 'scipy', 'tqdm'],
+    install_requires=['numpy>=1.17', 'scipy', 'tqdm'],
     extras_require={
         'test': ['pytest-cov', 'pytest', 'coverage', 'flaky'],
     },
@@ -20,21 +20,26 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import logging
-import multiprocessing as mp
 
-import tqdm
-
-from statdp.generators import generate_arguments, generate_databases, ALL_DIFFER, ONE_DIFFER
-from statdp.hypotest import hypothesis_test
-from statdp.selectors import select_event
-from statdp._hypergeom import use_gsl
+from statdp.cache import SampleCache
+from statdp.core import epsilon_key, seed_sequence, spawn_seed
+from statdp.executors import FuturesExecutor, WorkQueueExecutor
+from statdp.generators import generate_arguments, generate_databases, stream_databases, ALL_DIFFER, ONE_DIFFER
+from statdp.hypotest import hypothesis_test, hypothesis_tests
+from statdp.options import ExecutionOptions
+from statdp.selectors import select_event, select_events
+from statdp.session import Session
+from statdp.profiler import Profiler, phase, profiling
+from statdp.search_spaces import strategy_name
+from statdp.store import ResultStore, result_key
 
 logger = logging.getLogger(__name__)
 
 
 def detect_counterexample(algorithm, test_epsilon, default_kwargs=None, databases=None, num_input=(5, 10),
                           event_iterations=100000, detect_iterations=500000, cores=0, sensitivity=ALL_DIFFER,
-                          quiet=False, loglevel=logging.INFO):
+                          quiet=False, loglevel=logging.INFO, sequential=False, sweep=False, seed=None,
+                          search_space=None, adaptive=False, candidates=None, batch_size=None, execution=None):
     """
     :param algorithm: The algorithm to test for.
     :param test_epsilon: The privacy budget to test for, can either be a number or a tuple/list.
@@ -43,12 +48,43 @@ def detect_counterexample(algorithm, test_epsilon, default_kwargs=None, database
     :param num_input: The length of input to generate, not used if database param is specified.
     :param event_iterations: The iterations for event selector to run, default is 100000.
     :param detect_iterations: The iterations for detector to run, default is 500000.
-    :param cores: The cores to utilize, 0 means auto-detection.
+    :param cores: The cores to utilize, 0 means auto-detection. Not used if :execution: has a session.
     :param sensitivity: The sensitivity setting, all queries can differ by one or just one query can differ by one.
     :param quiet: Do not print progress bar or messages, logs are not affected, default is False.
     :param loglevel: The loglevel for logging package.
-    :return: [(epsilon, p, d1, d2, kwargs, event)] The epsilon-p pairs along with databases/arguments/selected event.
+    :param sequential: Run the hypothesis tests sequentially, i.e., stop early once the p-value is decided.
+    :param sweep: Run the algorithm once for event selection and once for detection and share the samples among all
+    test epsilons, cannot be used together with :sequential:.
+    :param seed: The seed (int or numpy.random.SeedSequence) for reproducible results, which do not depend on the number
+    of cores. Fresh entropy is used if None.
+    :param search_space: The strategy to generate the event search space of numerical return values for event selection,
+    e.g., statdp.search_spaces.quantiles, see statdp.search_spaces. statdp.search_spaces.densest is used if None.
+    :param adaptive: Screen the inputs for event selection by successive halving and only run the best few with the full
+    :event_iterations:, which usually selects the same input and event with far fewer iterations, see select_event.
+    Cannot be used together with :sweep:.
+    :param candidates: Stream this many candidate inputs for each length in :num_input: (the fixed patterns followed by
+    randomized and local search pairs, see statdp.generators.stream_databases) rather than only the fixed patterns.
+    Not used if :databases: is specified.
+    :param batch_size: Feed the inputs to the event selector in batches of at most this many inputs, so that memory is
+    bounded regardless of :candidates:. All inputs are selected from at once if None. Cannot be used with :sweep:.
+    :param execution: The statdp.ExecutionOptions of the session to run on, the result store, the profiler, the
+    sample cache and the spill directory. A new process pool is created (and closed) for this call if None.
+    :return: [(epsilon, p, d1, d2, kwargs, event)] The epsilon-p pairs along with databases/arguments/selected event,
+    followed by the iterations the test ran for if :sequential: is True, and the profiling totals if :execution: has a
+    profiler.
     """
+    if sequential and sweep:
+        raise ValueError('sequential and sweep cannot be used together')
+    if adaptive and sweep:
+        raise ValueError('adaptive and sweep cannot be used together')
+    if batch_size is not None and sweep:
+        raise ValueError('batch_size and sweep cannot be used together')
+    execution = execution if execution is not None else ExecutionOptions()
+    session, store, profiler, spill_dir = execution.session, execution.store, execution.profiler, execution.spill_dir
+    cache = execution.cache
+    # tqdm and multiprocessing are imported on use to keep `import statdp` fast
+    import multiprocessing as mp
+    import tqdm
     # initialize an empty default kwargs if None is given
     default_kwargs = default_kwargs if default_kwargs else {}
 
@@ -57,15 +93,6 @@ def detect_counterexample(algorithm, test_epsilon, default_kwargs=None, database
                 .format(algorithm.__name__, test_epsilon))
     logger.info('Options -> default_kwargs: {} | databases: {} | cores:{}'.format(default_kwargs, databases, cores))
 
-    # log warnings about gsl installation
-    if use_gsl:
-        logger.info('Found GSL installation, using GSL implementation of hypergeom.cdf for better performance.')
-    else:
-        logger.warning(
-            'Did not find Gnu Scientific Library (GSL) installation, falling back to scipy implementation of '
-            'hypergeom.cdf. Note that GSL provides much faster implementation than scipy which can '
-            'significantly increase detection performance.')
-
     input_list = []
     if databases is not None:
         d1, d2 = databases
@@ -73,7 +100,8 @@ def detect_counterexample(algorithm, test_epsilon, default_kwargs=None, database
         input_list = ((d1, d2, kwargs),)
     else:
         num_input = (int(num_input), ) if isinstance(num_input, (int, float)) else num_input
-        for num in num_input:
+        # the candidates are streamed for each epsilon from its own seed, see `inputs` below
+        for num in (num_input if candidates is None else ()):
             input_list.extend(
                 generate_databases(algorithm, num, default_kwargs=default_kwargs, sensitivity=sensitivity))
 
@@ -81,22 +109,102 @@ def detect_counterexample(algorithm, test_epsilon, default_kwargs=None, database
 
     # convert int/float or iterable into tuple (so that it has length information)
     test_epsilon = (test_epsilon, ) if isinstance(test_epsilon, (int, float)) else test_epsilon
+    # the results are keyed by the algorithm, the test epsilon and the settings the result depends on
+    if cache is not None and seed is None:
+        logger.warning('The sample cache is not used since no seed is given')
+        cache = None
+    settings = {'kwargs': default_kwargs, 'databases': databases, 'num_input': num_input,
+                'sensitivity': sensitivity.name, 'event_iterations': event_iterations,
+                'detect_iterations': detect_iterations, 'sequential': sequential, 'sweep': sweep, 'seed': seed}
+    # only the non-default options are part of the key, so that the results stored without them are still reused
+    if search_space is not None:
+        settings['search_space'] = strategy_name(search_space)
+    if adaptive:
+        settings['adaptive'] = adaptive
+    if candidates is not None:
+        settings.update(candidates=candidates, batch_size=batch_size)
+    if spill_dir is not None:
+        # the search space is generated from a summary of the spilled samples beyond a number of iterations
+        settings['spill'] = True
+    stored = {epsilon: store.get(result_key(algorithm, epsilon, **settings)) if store is not None else None
+              for epsilon in test_epsilon}
+    if any(stored.values()):
+        logger.info('Reusing {} stored results'.format(sum(value is not None for value in stored.values())))
+
+    def record(epsilon, local_result, local_profiler):
+        # write the result to the store as soon as it completes, and attach the profiling totals
+        if store is not None:
+            store.put(result_key(algorithm, epsilon, **settings), local_result)
+        return local_result + (local_profiler.totals(), ) if local_profiler is not None else local_result
+
+    def candidate_inputs(local_seed):
+        # the candidates are streamed afresh for each selection, from its own seed
+        if databases is not None or candidates is None:
+            return input_list
+        return stream_databases(algorithm, num_input, default_kwargs, sensitivity, candidates, local_seed)
+
+    if profiler is not None:
+        stored = {epsilon: value + (None, ) if value is not None else None for epsilon, value in stored.items()}
+
+    seed = seed_sequence(seed)
+
+    if all(value is not None for value in stored.values()):
+        return [stored[epsilon] for epsilon in test_epsilon]
+
+    if session is not None:
+        pool = session
+    else:
+        with profiling(profiler), phase('pool startup'):
+            pool = mp.Pool(mp.cpu_count()) if cores == 0 else (mp.Pool(cores) if cores != 1 else None)
+    def run_options(local_profiler):
+        # the execution options shared by the event selection and the hypothesis tests
+        return {'process_pool': pool, 'profiler': local_profiler, 'cache': cache}
 
-    pool = mp.Pool(mp.cpu_count()) if cores == 0 else (mp.Pool(cores) if cores != 1 else None)
     try:
-        for _, epsilon in tqdm.tqdm(enumerate(test_epsilon), total=len(test_epsilon), unit='test', desc='Detection',
-                                    disable=quiet):
-            d1, d2, kwargs, event = select_event(algorithm, input_list, epsilon, event_iterations, quiet=quiet,
-                                                 process_pool=pool)
+        if sweep:
+            # the selection and detection phases each sample once for all epsilons, and independently of each other
+            pending = tuple(epsilon for epsilon in test_epsilon if stored[epsilon] is None)
+            inputs = list(candidate_inputs(spawn_seed(seed, 2)))
+            local_profiler = profiler.child() if profiler is not None else None
+            input_event_pairs = select_events(algorithm, inputs, pending, event_iterations, quiet=quiet,
+                                              seed=spawn_seed(seed, 0), search_space=search_space,
+                                              spill_dir=spill_dir, **run_options(local_profiler))
+            p_values = hypothesis_tests(algorithm, input_event_pairs, pending, detect_iterations,
+                                        seed=spawn_seed(seed, 1), **run_options(local_profiler))
+            if profiler is not None:
+                profiler.merge(local_profiler)
+            for epsilon, p, (d1, d2, kwargs, event) in zip(pending, p_values, input_event_pairs):
+                stored[epsilon] = record(epsilon, (epsilon, float(p), d1, d2, kwargs, event), local_profiler)
+                if not quiet:
+                    tqdm.tqdm.write('Epsilon: {} | p-value: {:5.3f} | Event: {}'.format(epsilon, p, event))
+            return [stored[epsilon] for epsilon in test_epsilon]
+
+        for epsilon in tqdm.tqdm(test_epsilon, unit='test', desc='Detection', disable=quiet):
+            if stored[epsilon] is not None:
+                result.append(stored[epsilon])
+                continue
+            local_profiler = profiler.child() if profiler is not None else None
+            # the seeds are derived from the epsilon value like the store key, so that a result does not depend on the
+            # position of the epsilon, e.g., when the stored results of the others are reused
+            key = epsilon_key(epsilon)
+            inputs = candidate_inputs(spawn_seed(seed, key, 2))
+            d1, d2, kwargs, event = select_event(algorithm, inputs, epsilon, event_iterations, quiet=quiet,
+                                                 seed=spawn_seed(seed, key, 0), search_space=search_space,
+                                                 adaptive=adaptive, batch_size=batch_size, spill_dir=spill_dir,
+                                                 **run_options(local_profiler))
             p = hypothesis_test(algorithm, d1, d2, kwargs, event, epsilon, detect_iterations, report_p2=False,
-                                process_pool=pool)
-            result.append((epsilon, float(p), d1, d2, kwargs, event))
+                                sequential=sequential, seed=spawn_seed(seed, key, 1), **run_options(local_profiler))
+            p, iterations = p if sequential else (p, detect_iterations)
+            if profiler is not None:
+                profiler.merge(local_profiler)
+            local_result = (epsilon, float(p), d1, d2, kwargs, event) + ((iterations, ) if sequential else ())
+            result.append(record(epsilon, local_result, local_profiler))
             if not quiet:
-                tqdm.tqdm.write('Epsilon: {} | p-value: {:5.3f} | Event: {}'.format(epsilon, p, event))
+                tqdm.tqdm.write('Epsilon: {} | p-value: {:5.3f} | Event: {} | Iterations: {}'
+                                .format(epsilon, p, event, iterations))
             logger.debug('D1: {} | D2: {} | kwargs: {}'.format(d1, d2, kwargs))
     finally:
-        if pool:
+        if pool and session is None:
             pool.close()
             pool.join()
     return result
-
@@ -21,44 +21,272 @@
 # SOFTWARE.
 import os
 import sys
-import subprocess
+import json
+import math
 import shutil
-import ctypes
 import logging
+import collections
 
-from scipy.stats import hypergeom
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
-cdf = None
-use_gsl = True
+# the GSL library path found by gsl-config is cached in this file, so that it is only discovered once per machine
+_CACHE_FILE = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                           'statdp', 'gsl.json')
+_EXT = '.dylib' if 'darwin' in sys.platform else ('.so' if 'linux' in sys.platform else '.dll')
 
-# try to import hypergeometric cdf from Gnu Scientific Library (GSL)
-if shutil.which('gsl-config'):
+# (cdf, use_gsl), resolved on the first call of `get_cdf`, `uses_gsl` or `cdf`
+_backend = None
+
+
+def _find_gsl():
+    """ Find the directory of the GSL libraries with gsl-config.
+    :return: The library directory, None if GSL is not found.
+    """
+    import subprocess
+    if not shutil.which('gsl-config'):
+        return None
     proc = subprocess.run(['gsl-config', '--prefix'], stdout=subprocess.PIPE)
 
     # try to find the library file
     lib_path = os.path.join(proc.stdout.decode('utf-8').strip(), 'lib')
-    ext = '.dylib' if 'darwin' in sys.platform else ('.so' if 'linux' in sys.platform else '.dll')
-    if not os.path.exists(os.path.join(lib_path, 'libgslcblas{}'.format(ext))):
+    if not os.path.exists(os.path.join(lib_path, 'libgslcblas{}'.format(_EXT))):
         lib_path = os.path.join(lib_path, 'x86_64-linux-gnu')
-        if not os.path.exists(os.path.join(lib_path, 'libgslcblas{}'.format(ext))):
+        if not os.path.exists(os.path.join(lib_path, 'libgslcblas{}'.format(_EXT))):
             # libgsl not found
-            lib_path = None
-
-    if lib_path:
-        dll = ctypes.CDLL if 'darwin' in sys.platform or 'linux' in sys.platform else ctypes.WinDLL
-        # load libgslcblas first
-        dll(os.path.join(lib_path, 'libgslcblas{}'.format(ext)), mode=ctypes.RTLD_GLOBAL)
-        # load libgsl
-        libgsl = dll(os.path.join(lib_path, 'libgsl{}'.format(ext)))
-        hyper = libgsl.gsl_cdf_hypergeometric_P
-        hyper.restype = ctypes.c_double
-
-        def cdf(k, M, n, N):
-            return float(hyper(ctypes.c_int(k), ctypes.c_int(n), ctypes.c_int(M - n), ctypes.c_int(N)))
-
-# if failed to load GSL, fall back to scipy implementation
-if not cdf:
-    use_gsl = False
-    cdf = hypergeom.cdf
+            return None
+    return lib_path
+
+
+def _gsl_path():
+    """ The GSL library directory from the cache file, or discovered (and cached) if the cached result is stale, i.e.,
+    the cached directory is gone, or GSL was not found but gsl-config is available now. """
+    try:
+        with open(_CACHE_FILE, 'r') as f:
+            lib_path = json.load(f)['lib_path']
+        if (lib_path is None and not shutil.which('gsl-config')) or (lib_path and os.path.exists(lib_path)):
+            return lib_path
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    lib_path = _find_gsl()
+    try:
+        os.makedirs(os.path.dirname(_CACHE_FILE), exist_ok=True)
+        with open(_CACHE_FILE, 'w') as f:
+            json.dump({'lib_path': lib_path}, f)
+    except OSError:
+        logger.debug('cannot write the GSL cache file {}'.format(_CACHE_FILE))
+    return lib_path
+
+
+def _load_gsl(lib_path):
+    # load the hypergeometric cdf from Gnu Scientific Library (GSL)
+    import ctypes
+    dll = ctypes.CDLL if 'darwin' in sys.platform or 'linux' in sys.platform else ctypes.WinDLL
+    # load libgslcblas first
+    dll(os.path.join(lib_path, 'libgslcblas{}'.format(_EXT)), mode=ctypes.RTLD_GLOBAL)
+    # load libgsl
+    libgsl = dll(os.path.join(lib_path, 'libgsl{}'.format(_EXT)))
+    hyper = libgsl.gsl_cdf_hypergeometric_P
+    hyper.restype = ctypes.c_double
+
+    def cdf(k, M, n, N):
+        return float(hyper(ctypes.c_int(k), ctypes.c_int(n), ctypes.c_int(M - n), ctypes.c_int(N)))
+    return cdf
+
+
+def _resolve():
+    global _backend
+    if _backend is None:
+        lib_path, cdf = _gsl_path(), None
+        if lib_path:
+            try:
+                cdf = _load_gsl(lib_path)
+            except OSError:
+                logger.warning('failed to load GSL from {}'.format(lib_path))
+        # if failed to load GSL, fall back to scipy implementation
+        if cdf is None:
+            from scipy.stats import hypergeom
+            _backend = hypergeom.cdf, False
+        else:
+            _backend = cdf, True
+    return _backend
+
+
+# the backend is resolved lazily, so that importing statdp does not shell out to gsl-config
+def get_cdf():
+    """ :return: The hypergeometric cdf(k, M, n, N), from GSL if it is found and from scipy otherwise. """
+    return _resolve()[0]
+
+
+def uses_gsl():
+    """ :return: Whether the hypergeometric cdf is from GSL. """
+    return _resolve()[1]
+
+
+def cdf(k, M, n, N):
+    return get_cdf()(k, M, n, N)
+
+
+def gammaln(x):
+    # scipy is imported on the first use, since it takes most of the import time of statdp
+    from scipy.special import gammaln
+    return gammaln(x)
+
+
+# the number of standard deviations around the mean covered by the tail tables, the mass outside is negligible
+_TAIL_WIDTH = 20
+
+
+def log_choose(n, k):
+    return gammaln(n + 1) - gammaln(k + 1) - gammaln(n - k + 1)
+
+
+def _tail_table(M, n, N):
+    """ Build the upper cumulative tail of hypergeometric distribution (M total, n type I objects, N draws).
+    :return: (lower, tail) where tail[i] = P(X >= lower + i).
+    """
+    lower, upper = max(0, N - (M - n)), min(n, N)
+    mean = N * n / M
+    width = int(math.ceil(_TAIL_WIDTH * math.sqrt(mean * (M - n) / M * (M - N) / max(M - 1, 1)))) + _TAIL_WIDTH
+    lower, upper = max(lower, int(mean) - width), min(upper, int(mean) + width)
+    ks = np.arange(lower, upper + 1, dtype=np.float64)
+    # the terms that do not depend on k are cancelled out by the normalization
+    log_pmf = -(gammaln(ks + 1) + gammaln(n - ks + 1) + gammaln(N - ks + 1) + gammaln(M - n - N + ks + 1))
+    pmf = np.exp(log_pmf - log_pmf.max())
+    pmf /= pmf.sum()
+    # sum up from the far end of the tail so that small tail probabilities keep their relative accuracy
+    tail = np.cumsum(pmf[::-1])[::-1]
+    # P(X >= lower) is 1 by definition, avoid the rounding errors of the normalization
+    tail[0] = 1.0
+    return lower, tail
+
+
+def _lookup(lower, tail, ks):
+    # P(X >= k) is 1 below the table and 0 above the table
+    padded = np.concatenate(((1.0, ), tail, (0.0, )))
+    return padded[np.clip(ks - lower + 1, 0, len(padded) - 1)]
+
+
+class TailCache:
+    """ LRU cache of the cumulative tail tables used by sf_many, bounded by the memory the tables take. """
+
+    def __init__(self, maxbytes=64 * 1024 * 1024):
+        """
+        :param maxbytes: The maximum number of bytes the cached tables can take.
+        """
+        self.maxbytes = maxbytes
+        self.hits, self.misses, self.nbytes = 0, 0, 0
+        self._tables = collections.OrderedDict()
+
+    def get(self, key, build):
+        """ Get the table for :key:, :build: is called to create the table on a cache miss. """
+        if key in self._tables:
+            self.hits += 1
+            self._tables.move_to_end(key)
+            return self._tables[key]
+        self.misses += 1
+        table = build()
+        self._tables[key] = table
+        self.nbytes += table[1].nbytes
+        self._evict()
+        return table
+
+    def resize(self, maxbytes):
+        """ Change the memory cap and evict the least recently used tables if necessary. """
+        self.maxbytes = maxbytes
+        self._evict()
+
+    def clear(self):
+        self._tables.clear()
+        self.hits, self.misses, self.nbytes = 0, 0, 0
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'tables': len(self._tables),
+                'nbytes': self.nbytes, 'maxbytes': self.maxbytes}
+
+    def _evict(self):
+        while self.nbytes > self.maxbytes and self._tables:
+            _, (_, table) = self._tables.popitem(last=False)
+            self.nbytes -= table.nbytes
+
+
+tail_cache = TailCache()
+
+
+def _draws_table(M, n, N):
+    return tail_cache.get(('draws', M, n, N), lambda: _tail_table(M, n, N))
+
+
+def _line_table(M, n, c):
+    """ Build P(Y_N <= c) for all N where it is not negligible, Y_N = N - X ~ Hypergeom(M, M - n, N) being the number
+    of type II objects drawn. It satisfies the recurrence P(Y_N <= c) = P(Y_{N+1} <= c) + P(Y_N = c) * (M - n - c) /
+    (M - N), so the table is built from one tail table at the largest N and a cumulative sum.
+    :return: (low, table) where table[i] = P(Y_{low + i} <= c).
+    """
+    # the range of N where E[Y_N] is within _TAIL_WIDTH standard deviations (and a margin) of c, i.e., solve
+    # |N * p - c| = _TAIL_WIDTH * (sqrt(N * p * q) + 1) for sqrt(N), the finite population correction is left out
+    p, q = (M - n) / M, n / M
+    spread = _TAIL_WIDTH * math.sqrt(p * q)
+    low = (-spread + math.sqrt(spread ** 2 + 4 * p * max(c - _TAIL_WIDTH, 0))) / (2 * p)
+    high = (spread + math.sqrt(spread ** 2 + 4 * p * (c + _TAIL_WIDTH))) / (2 * p)
+    low, high = max(c, int(low ** 2)), min(M, int(math.ceil(high ** 2)))
+    lower, tail = _draws_table(M, n, high)
+    anchor = _lookup(lower, tail, high - c)
+    between = np.arange(low, high, dtype=np.float64)
+    valid = (between - c >= 0) & (between - c <= n)
+    type_one = np.where(valid, between - c, 0)
+    # the probabilities of the invalid N are zero, and their (meaningless) log pmf could overflow
+    log_pmf = np.where(valid, log_choose(n, type_one) + log_choose(M - n, c) - log_choose(M, between), -np.inf)
+    terms = np.exp(log_pmf) * (M - n - c) / (M - between)
+    # sum up from the largest N so that small tail probabilities keep their relative accuracy
+    return low, np.minimum(anchor + np.append(np.cumsum(terms[::-1])[::-1], 0.0), 1.0)
+
+
+def _group(keys):
+    # split the indices of :keys: into groups of equal keys
+    order = np.argsort(keys, kind='stable')
+    values, starts = np.unique(keys[order], return_index=True)
+    return zip(values.tolist(), np.split(order, starts[1:]))
+
+
+def _sf_by_draws(ks, M, n, N, out):
+    # one tail table for each distinct N
+    for draws, index in _group(N):
+        lower, tail = _draws_table(M, n, draws)
+        out[index] = _lookup(lower, tail, ks[index] + 1)
+
+
+def _sf_by_line(ks, M, n, N, out):
+    # P(X > k) = P(Y_N <= c) where c = N - k - 1, one table for each distinct c
+    for c, index in _group(N - ks - 1):
+        if c < 0 or c >= M - n:
+            out[index] = 0.0 if c < 0 else 1.0
+            continue
+        low, table = tail_cache.get(('line', M, n, c), lambda: _line_table(M, n, c))
+        # P(Y_N <= c) is 1 for smaller N and 0 for larger N than the table covers
+        out[index] = _lookup(low, table, N[index])
+
+
+def sf_many(ks, M, n, N):
+    """ Vectorized survival function P(X > k) of hypergeometric distribution, parametrized as scipy.stats.hypergeom.
+    The queries are grouped by either N or N - k (whichever yields fewer groups) and each group is answered by lookup
+    from a cumulative tail table built with log-gamma and cumulative sum arithmetic, the tables are kept in
+    `tail_cache` for later queries.
+    :param ks: The array of k to evaluate.
+    :param M: The total number of objects.
+    :param n: The number of type I objects.
+    :param N: The number of draws, either a number or an array of the same shape as ks.
+    :return: The array of P(X > k).
+    """
+    ks, N = np.broadcast_arrays(np.asarray(ks, dtype=np.int64), np.asarray(N, dtype=np.int64))
+    shape = ks.shape
+    ks, N = ks.ravel(), N.ravel()
+    out = np.empty(len(ks), dtype=np.float64)
+    if len(ks) != 0:
+        if len(np.unique(N)) <= len(np.unique(N - ks)):
+            _sf_by_draws(ks, M, n, N, out)
+        else:
+            _sf_by_line(ks, M, n, N, out)
+    return out.reshape(shape)
@@ -23,49 +23,113 @@ from itertools import zip_longest
 
 import numpy as np
 
+from statdp.core import batched
+
+
+def _generator(rng):
+    # the algorithms draw from the given numpy.random.Generator, or the legacy global random state if None
+    return np.random if rng is None else rng
+
 
 def _hamming_distance(result1, result2):
     # implement hamming distance in pure python, faster than np.count_zeros if inputs are plain python list
     return sum(res1 != res2 for res1, res2 in zip_longest(result1, result2))
 
 
-def noisy_max_v1a(queries, epsilon):
+def noisy_max_v1a(queries, epsilon, rng=None):
+    rng = _generator(rng)
     # find the largest noisy element and return its index
-    return (np.asarray(queries, dtype=np.float64) + np.random.laplace(scale=2.0 / epsilon, size=len(queries))).argmax()
+    return (np.asarray(queries, dtype=np.float64) + rng.laplace(scale=2.0 / epsilon, size=len(queries))).argmax()
 
 
-def noisy_max_v1b(queries, epsilon):
+def noisy_max_v1b(queries, epsilon, rng=None):
+    rng = _generator(rng)
     # INCORRECT: returning maximum value instead of the index
-    return (np.asarray(queries, dtype=np.float64) + np.random.laplace(scale=2.0 / epsilon, size=len(queries))).max()
+    return (np.asarray(queries, dtype=np.float64) + rng.laplace(scale=2.0 / epsilon, size=len(queries))).max()
 
 
-def noisy_max_v2a(queries, epsilon):
-    return (np.asarray(queries, dtype=np.float64) + np.random.exponential(scale=2.0 / epsilon, size=len(queries))).argmax()
+def noisy_max_v2a(queries, epsilon, rng=None):
+    rng = _generator(rng)
+    return (np.asarray(queries, dtype=np.float64) + rng.exponential(scale=2.0 / epsilon, size=len(queries))).argmax()
 
 
-def noisy_max_v2b(queries, epsilon):
+def noisy_max_v2b(queries, epsilon, rng=None):
+    rng = _generator(rng)
     # INCORRECT: returning the maximum value instead of the index
-    return (np.asarray(queries, dtype=np.float64) + np.random.exponential(scale=2.0 / epsilon, size=len(queries))).max()
+    return (np.asarray(queries, dtype=np.float64) + rng.exponential(scale=2.0 / epsilon, size=len(queries))).max()
 
 
-def histogram_eps(queries, epsilon):
+def histogram_eps(queries, epsilon, rng=None):
+    rng = _generator(rng)
     # INCORRECT: using (epsilon) noise instead of (1 / epsilon)
-    noisy_array = np.asarray(queries, dtype=np.float64) + np.random.laplace(scale=epsilon, size=len(queries))
+    noisy_array = np.asarray(queries, dtype=np.float64) + rng.laplace(scale=epsilon, size=len(queries))
     return noisy_array[0]
 
 
-def histogram(queries, epsilon):
-    noisy_array = np.asarray(queries, dtype=np.float64) + np.random.laplace(scale=1.0 / epsilon, size=len(queries))
+def histogram(queries, epsilon, rng=None):
+    rng = _generator(rng)
+    noisy_array = np.asarray(queries, dtype=np.float64) + rng.laplace(scale=1.0 / epsilon, size=len(queries))
     return noisy_array[0]
 
 
-def SVT(queries, epsilon, N, T):
+@batched
+def noisy_max_v1a_batched(queries, epsilon, size, rng=None):
+    rng = _generator(rng)
+    noisy_array = np.asarray(queries, dtype=np.float64) + \
+        rng.laplace(scale=2.0 / epsilon, size=(size, len(queries)))
+    return noisy_array.argmax(axis=1)
+
+
+@batched
+def noisy_max_v1b_batched(queries, epsilon, size, rng=None):
+    rng = _generator(rng)
+    # INCORRECT: returning maximum value instead of the index
+    noisy_array = np.asarray(queries, dtype=np.float64) + \
+        rng.laplace(scale=2.0 / epsilon, size=(size, len(queries)))
+    return noisy_array.max(axis=1)
+
+
+@batched
+def noisy_max_v2a_batched(queries, epsilon, size, rng=None):
+    rng = _generator(rng)
+    noisy_array = np.asarray(queries, dtype=np.float64) + \
+        rng.exponential(scale=2.0 / epsilon, size=(size, len(queries)))
+    return noisy_array.argmax(axis=1)
+
+
+@batched
+def noisy_max_v2b_batched(queries, epsilon, size, rng=None):
+    rng = _generator(rng)
+    # INCORRECT: returning the maximum value instead of the index
+    noisy_array = np.asarray(queries, dtype=np.float64) + \
+        rng.exponential(scale=2.0 / epsilon, size=(size, len(queries)))
+    return noisy_array.max(axis=1)
+
+
+@batched
+def histogram_eps_batched(queries, epsilon, size, rng=None):
+    rng = _generator(rng)
+    # INCORRECT: using (epsilon) noise instead of (1 / epsilon)
+    noisy_array = np.asarray(queries, dtype=np.float64) + rng.laplace(scale=epsilon, size=(size, len(queries)))
+    return noisy_array[:, 0]
+
+
+@batched
+def histogram_batched(queries, epsilon, size, rng=None):
+    rng = _generator(rng)
+    noisy_array = np.asarray(queries, dtype=np.float64) + \
+        rng.laplace(scale=1.0 / epsilon, size=(size, len(queries)))
+    return noisy_array[:, 0]
+
+
+def SVT(queries, epsilon, N, T, rng=None):
+    rng = _generator(rng)
     out = []
-    eta1 = np.random.laplace(scale=2.0 / epsilon)
+    eta1 = rng.laplace(scale=2.0 / epsilon)
     noisy_T = T + eta1
     c1 = 0
     for query in queries:
-        eta2 = np.random.laplace(scale=4.0 * N / epsilon)
+        eta2 = rng.laplace(scale=4.0 * N / epsilon)
         if query + eta2 >= noisy_T:
             out.append(True)
             c1 += 1
@@ -76,9 +140,10 @@ def SVT(queries, epsilon, N, T):
     return out.count(False)
 
 
-def iSVT1(queries, epsilon, N, T):
+def iSVT1(queries, epsilon, N, T, rng=None):
+    rng = _generator(rng)
     out = []
-    eta1 = np.random.laplace(scale=2.0 / epsilon)
+    eta1 = rng.laplace(scale=2.0 / epsilon)
     noisy_T = T + eta1
     for query in queries:
         # INCORRECT: no noise added to the queries
@@ -92,13 +157,14 @@ def iSVT1(queries, epsilon, N, T):
     return _hamming_distance((True if i < true_count else False for i in range(len(queries))), out)
 
 
-def iSVT2(queries, epsilon, N, T):
+def iSVT2(queries, epsilon, N, T, rng=None):
+    rng = _generator(rng)
     out = []
-    eta1 = np.random.laplace(scale=2.0 / epsilon)
+    eta1 = rng.laplace(scale=2.0 / epsilon)
     noisy_T = T + eta1
     for query in queries:
         # INCORRECT: noise added to queries doesn't scale with N
-        eta2 = np.random.laplace(scale=2.0 / epsilon)
+        eta2 = rng.laplace(scale=2.0 / epsilon)
         if (query + eta2) >= noisy_T:
             out.append(True)
             # INCORRECT: no bounds on the True's to output
@@ -109,14 +175,15 @@ def iSVT2(queries, epsilon, N, T):
     return _hamming_distance((True if i < true_count else False for i in range(len(queries))), out)
 
 
-def iSVT3(queries, epsilon, N, T):
+def iSVT3(queries, epsilon, N, T, rng=None):
+    rng = _generator(rng)
     out = []
-    eta1 = np.random.laplace(scale=4.0 / epsilon)
+    eta1 = rng.laplace(scale=4.0 / epsilon)
     noisy_T = T + eta1
     c1 = 0
     for query in queries:
         # INCORRECT: noise added to queries doesn't scale with N
-        eta2 = np.random.laplace(scale=4.0 / (3.0 * epsilon))
+        eta2 = rng.laplace(scale=4.0 / (3.0 * epsilon))
         if query + eta2 > noisy_T:
             out.append(True)
             c1 += 1
@@ -129,13 +196,14 @@ def iSVT3(queries, epsilon, N, T):
     return _hamming_distance((True if i < true_count else False for i in range(len(queries))), out)
 
 
-def iSVT4(queries, epsilon, N, T):
+def iSVT4(queries, epsilon, N, T, rng=None):
+    rng = _generator(rng)
     out = []
-    eta1 = np.random.laplace(scale=2.0 / epsilon)
+    eta1 = rng.laplace(scale=2.0 / epsilon)
     noisy_T = T + eta1
     c1 = 0
     for query in queries:
-        eta2 = np.random.laplace(scale=2.0 * N / epsilon)
+        eta2 = rng.laplace(scale=2.0 * N / epsilon)
         if query + eta2 > noisy_T:
             # INCORRECT: Output the noisy query instead of True
             out.append(query + eta2)
@@ -145,3 +213,70 @@ def iSVT4(queries, epsilon, N, T):
         else:
             out.append(False)
     return out.count(False), out[-1]
+
+
+def _sparse_vector(queries, T, threshold_scale, query_scale, size, rng, strict=False):
+    # draw one noisy threshold per iteration and an (iterations × queries) noise matrix for the queries
+    queries = np.asarray(queries, dtype=np.float64)
+    noisy_T = T + rng.laplace(scale=threshold_scale, size=(size, 1))
+    noisy_queries = queries + rng.laplace(scale=query_scale, size=(size, len(queries))) if query_scale \
+        else np.broadcast_to(queries, (size, len(queries)))
+    above = noisy_queries > noisy_T if strict else noisy_queries >= noisy_T
+    return noisy_queries, above
+
+
+def _answered(above, N):
+    # a query is answered if less than N True's have been output before it, i.e., the algorithm stops after N True's
+    return (np.cumsum(above, axis=1) - above) < N
+
+
+def _true_pattern(length):
+    # the expected output of the iSVT variants, the first half being True and the rest being False
+    return np.arange(length) < int(length / 2)
+
+
+@batched
+def SVT_batched(queries, epsilon, N, T, size, rng=None):
+    rng = _generator(rng)
+    _, above = _sparse_vector(queries, T, 2.0 / epsilon, 4.0 * N / epsilon, size, rng)
+    return np.count_nonzero(_answered(above, N) & ~above, axis=1)
+
+
+@batched
+def iSVT1_batched(queries, epsilon, N, T, size, rng=None):
+    rng = _generator(rng)
+    # INCORRECT: no noise added to the queries
+    _, above = _sparse_vector(queries, T, 2.0 / epsilon, 0, size, rng)
+    return np.count_nonzero(above != _true_pattern(len(queries)), axis=1)
+
+
+@batched
+def iSVT2_batched(queries, epsilon, N, T, size, rng=None):
+    rng = _generator(rng)
+    # INCORRECT: noise added to queries doesn't scale with N and no bounds on the True's to output
+    _, above = _sparse_vector(queries, T, 2.0 / epsilon, 2.0 / epsilon, size, rng)
+    return np.count_nonzero(above != _true_pattern(len(queries)), axis=1)
+
+
+@batched
+def iSVT3_batched(queries, epsilon, N, T, size, rng=None):
+    rng = _generator(rng)
+    # INCORRECT: noise added to queries doesn't scale with N
+    _, above = _sparse_vector(queries, T, 4.0 / epsilon, 4.0 / (3.0 * epsilon), size, rng, strict=True)
+    answered = _answered(above, N)
+    # the unanswered queries are always counted as different, same as the zip_longest in _hamming_distance
+    return np.count_nonzero(answered & (above != _true_pattern(len(queries))), axis=1) + \
+        np.count_nonzero(~answered, axis=1)
+
+
+@batched
+def iSVT4_batched(queries, epsilon, N, T, size, rng=None):
+    rng = _generator(rng)
+    noisy_queries, above = _sparse_vector(queries, T, 2.0 / epsilon, 2.0 * N / epsilon, size, rng, strict=True)
+    answered = _answered(above, N)
+    # answered queries always form a prefix, so the last output is at index (number of answered queries - 1)
+    last = np.count_nonzero(answered, axis=1) - 1
+    rows = np.arange(size)
+    # INCORRECT: Output the noisy query instead of True
+    last_output = np.where(above[rows, last], noisy_queries[rows, last], 0.0)
+    return np.column_stack((np.count_nonzero(answered & ~above, axis=1), last_output))
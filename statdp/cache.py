@@ -0,0 +1,220 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import contextlib
+import hashlib
+import logging
+import os
+import threading
+import types
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# the sample cache activated in the current thread, see caching
+_local = threading.local()
+
+
+def active_cache():
+    """
+    :return: The SampleCache activated in the current thread, None if the samples are not cached.
+    """
+    return getattr(_local, 'cache', None)
+
+
+@contextlib.contextmanager
+def caching(cache, seed=None):
+    """ Activate :cache: in the current thread for the samples drawn in the block. No-op if :cache: is None, or if
+    :seed: is None since samples from fresh entropy would never be drawn again.
+    """
+    if cache is None or seed is None:
+        yield None
+        return
+    previous, _local.cache = active_cache(), cache
+    try:
+        yield cache
+    finally:
+        _local.cache = previous
+
+
+def cached(cache, func, item):
+    """ Run func(item) with :cache: activated, e.g., in a worker of the pool. """
+    previous, _local.cache = active_cache(), cache
+    try:
+        return func(item)
+    finally:
+        _local.cache = previous
+
+
+def content(database):
+    """ The content of :database: (list or numpy array) to hash, which is the same for equal lists and arrays. """
+    array = np.asarray(database)
+    return repr(database) if array.dtype == object else (array.dtype.str, array.shape, array.tobytes())
+
+
+def _hash_code(digest, code):
+    # the bytecode, names and constants of the code object and its nested code objects (e.g., of inner functions)
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            _hash_code(digest, constant)
+        else:
+            digest.update(repr(constant).encode())
+
+
+def _hash_value(digest, value, seen):
+    # functions (e.g., in the closure cells) are hashed by their code, default arguments and closure cells, and the
+    # other values by their content or repr, :seen: holds the ids of the functions on the path to stop at recursion
+    if isinstance(value, types.FunctionType):
+        digest.update(b'function')
+        if id(value) in seen:
+            return
+        seen = seen | {id(value)}
+        _hash_code(digest, value.__code__)
+        _hash_value(digest, value.__defaults__ or (), seen)
+        _hash_value(digest, sorted((value.__kwdefaults__ or {}).items()), seen)
+        for cell in value.__closure__ or ():
+            try:
+                contents = cell.cell_contents
+            except ValueError:
+                # the cell is not filled yet
+                contents = None
+            _hash_value(digest, contents, seen)
+    elif isinstance(value, (tuple, list)):
+        digest.update('{}{}'.format(type(value).__name__, len(value)).encode())
+        for item in value:
+            _hash_value(digest, item, seen)
+    elif isinstance(value, np.ndarray):
+        digest.update(repr(content(value)).encode())
+    else:
+        digest.update(repr(value).encode())
+
+
+class SampleCache:
+    """ Content-addressed on-disk cache of the raw outputs of algorithms, one .npy file for each chunk of iterations.
+    The chunks are keyed by the hash of the algorithm's code (bytecode and constants), its default arguments and the
+    contents of its closure cells (but not the globals or the functions it calls), the keyword arguments, the database,
+    the number of iterations and the seed of the chunk, so a run with the same seed draws the chunks it has run before
+    from the cache and runs (and stores) only the ones it has not, e.g., when it takes more iterations than before.
+    The least recently used chunks are removed once the files exceed the size cap. The directory can be shared by
+    concurrent processes on the same host, the files are written atomically.
+    """
+
+    def __init__(self, path, max_bytes=1 << 30):
+        """
+        :param path: The directory of the files, created on the first write if it does not exist.
+        :param max_bytes: The cap of the total size of the files.
+        """
+        self.path, self.max_bytes = path, max_bytes
+        # the estimated total size of the files, from the last scan of the directory plus the files written since
+        self._size = None
+
+    def key(self, algorithm, database, kwargs, iterations, seed):
+        """
+        :param seed: The numpy.random.SeedSequence the samples are drawn from.
+        :return: The key of the samples, None if they cannot be cached (the algorithm has no __code__).
+        """
+        code = getattr(algorithm, '__code__', None)
+        if code is None:
+            return None
+        digest = hashlib.sha256('{}.{}'.format(algorithm.__module__, algorithm.__qualname__).encode())
+        _hash_value(digest, getattr(algorithm, '__func__', algorithm), set())
+        digest.update(repr((content(database), sorted((kwargs or {}).items()), iterations,
+                            seed.entropy, seed.spawn_key, seed.pool_size)).encode())
+        return digest.hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.npy')
+
+    def get(self, key):
+        """
+        :return: The cached samples (tuple of numpy arrays, one row for each return value) of :key:, None on a miss.
+        """
+        path = self._file(key)
+        try:
+            entry = np.load(path, mmap_mode='r')
+            result = tuple(np.array(entry[name]) for name in entry.dtype.names)
+        except (OSError, ValueError, TypeError):
+            # missing, removed by another process or partially written by an older version of the file
+            return None
+        try:
+            # the modification time is the last use of the entry for the LRU order
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, result):
+        """ Store the samples :result: (tuple of numpy arrays) for :key:, the samples of python objects are not stored.
+        """
+        if not result or any(np.asarray(row).dtype == object for row in result):
+            return
+        entry = np.empty(len(result[0]), dtype=[('r{}'.format(row), np.asarray(values).dtype)
+                                                for row, values in enumerate(result)])
+        for row, values in enumerate(result):
+            entry['r{}'.format(row)] = values
+        os.makedirs(self.path, exist_ok=True)
+        path = self._file(key)
+        temporary = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        with open(temporary, 'wb') as f:
+            np.save(f, entry)
+        os.replace(temporary, path)
+        self._size = (self._size if self._size is not None else self._scan()[0]) + os.path.getsize(path)
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _scan(self):
+        # :return: (total size, [(modification time, size, path), ...]) of the files
+        files = []
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.name.endswith('.npy'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        return sum(size for _, size, _ in files), files
+
+    def _evict(self):
+        # remove the least recently used files until the files fit in the size cap
+        total, files = self._scan()
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        logger.debug('sample cache {} is evicted to {} bytes'.format(self.path, total))
+        self._size = total
+
+    def clear(self):
+        """ Remove all files of the cache. """
+        for _, _, path in self._scan()[1] if os.path.isdir(self.path) else ():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._size = 0
@@ -20,105 +20,466 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import numpy as np
+import hashlib
+import inspect
 import itertools
 import logging
+import os
+import tempfile
+
+from statdp.cache import active_cache, caching, content
+from statdp.executors import in_thread_pool
+from statdp.profiler import add_calls, phase, profiling
+from statdp.search_spaces import densest
 
 
 logger = logging.getLogger(__name__)
 
+# the default iterations to run in one chunk, the chunks are also the units of seeding
+CHUNK_SIZE = 10000
+# the iterations of the spilled samples (see run_algorithm's spill_dir) read from the files at a time
+BLOCK_SIZE = 1 << 20
+# the maximum number of spilled results of a return value to generate its search space from, more results are thinned
+# to every k-th value of each sorted block, which shifts the rank of each value by at most k per block
+_MAX_SUMMARY = 1 << 22
+
+
+def batched(algorithm):
+    """ Mark :algorithm: as batched, i.e., it takes an extra `size` keyword argument and returns an array with one
+    result per iteration (a 2-D array of shape (size, number of return values) if it returns multiple values).
+    :param algorithm: The algorithm to mark.
+    :return: The same algorithm, marked as batched.
+    """
+    algorithm.batched = True
+    return algorithm
+
+
+def is_batched(algorithm):
+    """ Check whether :algorithm: follows the batched protocol, see :func:`batched`. """
+    return getattr(algorithm, 'batched', False)
+
+
+def accepts_rng(algorithm):
+    """ Check whether :algorithm: takes an `rng` keyword argument, i.e., a numpy.random.Generator to draw from. """
+    try:
+        return 'rng' in inspect.signature(algorithm).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def seed_sequence(seed):
+    """ Convert :seed: (None, int or numpy.random.SeedSequence) to numpy.random.SeedSequence, None gives a sequence
+    with fresh entropy from the OS. """
+    return seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+
+def spawn_seed(seed, *keys):
+    """ Get the child SeedSequence of :seed: at spawn key :keys:, children with different keys are independent.
+    Unlike SeedSequence.spawn the children are addressed by keys, so that e.g. each chunk of iterations gets the same
+    child no matter which process runs it.
+    """
+    seed = seed_sequence(seed)
+    return np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + keys, pool_size=seed.pool_size)
+
+
+def _digest_key(value):
+    digest = hashlib.sha256(repr(value).encode()).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+def _database_key(database, kwargs):
+    # the digest of the database and the arguments the algorithm runs on, which identifies the samples and seeds them
+    return _digest_key((content(database), sorted((kwargs or {}).items())))
+
+
+def epsilon_key(epsilon):
+    """ The spawn key of test :epsilon: (see spawn_seed), derived from its value so that the seeds of an epsilon do not
+    depend on the other epsilons tested along with it, e.g., when the stored results of some epsilons are reused. """
+    return _digest_key(float(epsilon))
+
+
+def _sample(algorithm, database, kwargs, iterations, seed=None):
+    """ Run the algorithm on :database: for :iterations: times, or draw the samples from the active sample cache.
+    :param seed: The SeedSequence to draw from, passed as numpy.random.Generator to algorithms accepting `rng`,
+    or used to seed the legacy global random state otherwise.
+    :return: tuple of numpy arrays, one row for each return value of the algorithm.
+    """
+    seed, cache = seed_sequence(seed), active_cache()
+    key = cache.key(algorithm, database, kwargs, iterations, seed) if cache is not None else None
+    if key is not None:
+        with phase('cache'):
+            result = cache.get(key)
+        if result is not None:
+            return result
+    result = _run(algorithm, database, kwargs, iterations, seed)
+    if key is not None:
+        with phase('cache'):
+            cache.put(key, result)
+    return result
+
+
+def _run(algorithm, database, kwargs, iterations, seed):
+    # run the algorithm on :database: for :iterations: times, see _sample
+    add_calls(iterations)
+    with phase('sampling'):
+        if accepts_rng(algorithm):
+            kwargs = dict(kwargs, rng=np.random.default_rng(seed))
+        elif in_thread_pool():
+            # the threads would reseed and draw from the same global random state at the same time
+            raise ValueError('Algorithm {} without an `rng` argument cannot run on threads, add the argument or use a '
+                             'process executor'.format(getattr(algorithm, '__name__', algorithm)))
+        else:
+            np.random.seed(seed.generate_state(4))
+
+        if is_batched(algorithm):
+            result = np.asarray(algorithm(database, size=iterations, **kwargs))
+            if result.ndim == 1:
+                return result,
+            elif result.ndim == 2:
+                return tuple(result[:, column] for column in range(result.shape[1]))
+            raise ValueError('Batched algorithm should return an 1-D or 2-D array, got shape {}'.format(result.shape))
+
+        # get return type by a sample run
+        sample_result = algorithm(database, **kwargs)
+        if np.issubdtype(type(sample_result), np.number):
+            return np.fromiter((algorithm(database, **kwargs) for _ in range(iterations)),
+                               dtype=type(sample_result), count=iterations),
+        elif isinstance(sample_result, (tuple, list)):
+            # run the algorithm and store the corresponding return value into vanilla python list first
+            result = tuple([] for _ in range(len(sample_result)))
+            for _ in range(iterations):
+                for row, value in enumerate(algorithm(database, **kwargs)):
+                    result[row].append(value)
+            # convert the python list to numpy array
+            return tuple(np.asarray(row) for row in result)
+        else:
+            raise ValueError('Unsupported return type: {}'.format(type(sample_result)))
+
+
+# the maximum number of cells in the joint histogram of multiple return values before falling back to masks
+_MAX_CELLS = 1 << 22
+
+
+def _partition(events):
+    """ Partition the real line by the endpoints of :events: of a return value, with cell 2i + 1 being the i-th
+    endpoint, cell 2i being the open interval between the (i-1)-th and i-th endpoints and the last cell for NaN.
+    :return: (endpoints, membership) where membership[cell, j] indicates whether the cell belongs to the j-th event.
+    """
+    points = []
+    for event in events:
+        points.extend((event, ) if np.issubdtype(type(event), np.number) else event)
+    endpoints = np.unique(np.asarray(points, dtype=np.float64))
+    membership = np.zeros((2 * len(endpoints) + 2, len(events)), dtype=np.int64)
+    for column, event in enumerate(events):
+        if np.issubdtype(type(event), np.number):
+            membership[2 * np.searchsorted(endpoints, event) + 1, column] = 1
+        else:
+            # open interval (low, high) covers the cells strictly between the two endpoints
+            low, high = np.searchsorted(endpoints, event)
+            membership[2 * low + 2:2 * high + 1, column] = 1
+    return endpoints, membership
+
+
+def _cells(endpoints, values):
+    # the cell each value falls into, see _partition
+    cells = np.searchsorted(endpoints, values, side='left') + np.searchsorted(endpoints, values, side='right')
+    if np.issubdtype(values.dtype, np.floating):
+        cells[np.isnan(values)] = 2 * len(endpoints) + 1
+    return cells
+
+
+def _count_events(result_d1, result_d2, event_search_space):
+    """ Count the iterations of both inputs that fall into each event of the search space, each return value is
+    bucketed once by the event endpoints and all events are counted from the (joint) histogram of the buckets.
+    :return: numpy array of (cx, cy) for each event, in the order of itertools.product(*event_search_space).
+    """
+    partitions = tuple(_partition(events) for events in event_search_space)
+    shape = tuple(len(membership) for _, membership in partitions)
+    counts = []
+    for result in (result_d1, result_d2):
+        cells = tuple(_cells(endpoints, np.asarray(row)) for (endpoints, _), row in zip(partitions, result))
+        if int(np.prod(shape)) <= _MAX_CELLS:
+            histogram = np.bincount(np.ravel_multi_index(cells, shape), minlength=int(np.prod(shape))).reshape(shape)
+            # contract each axis of the histogram with the memberships, the remaining axes are the events
+            for _, membership in partitions:
+                histogram = np.tensordot(histogram, membership, axes=([0], [0]))
+            counts.append(histogram.ravel())
+        else:
+            # the joint histogram is too large, check the cells against each event separately instead
+            event_counts = []
+            for columns in itertools.product(*(range(len(events)) for events in event_search_space)):
+                check = np.full(len(cells[0]), True)
+                for row_cells, column, (_, membership) in zip(cells, columns, partitions):
+                    check &= membership[row_cells, column] != 0
+                event_counts.append(np.count_nonzero(check))
+            counts.append(np.asarray(event_counts, dtype=np.int64))
+    return np.column_stack(counts)
+
+
+def _chunks(iterations, chunk_size):
+    # split the iterations into chunks of at most chunk_size iterations
+    return [chunk_size] * (iterations // chunk_size) + ([iterations % chunk_size] if iterations % chunk_size else [])
+
+
+def _sample_chunks(algorithm, database, kwargs, iterations, chunk_size, seed):
+    # run the algorithm chunk by chunk so that intermediate results (e.g., noise matrices of batched algorithms)
+    # are bounded by the chunk size, and concatenate the results of all chunks
+    chunks = [_sample(algorithm, database, kwargs, size, seed=spawn_seed(seed, index))
+              for index, size in enumerate(_chunks(iterations, chunk_size))]
+    return tuple(np.concatenate(rows) for rows in zip(*chunks))
+
+
+def _search_space(result_d1, result_d2, iterations, strategy=None):
+    # get desired search space for each return value
+    strategy = densest if strategy is None else strategy
+    event_search_space = []
+    for row in range(len(result_d1)):
+        # determine the event search space based on the return type
+        combined_result = np.concatenate((result_d1[row], result_d2[row]))
+        unique = np.unique(combined_result)
+
+        # categorical output
+        if len(unique) < iterations * 0.002:
+            event_search_space.append(tuple(int(key) for key in unique))
+        else:
+            combined_result.sort()
+            event_search_space.append(tuple(strategy(combined_result)))
+    return tuple(event_search_space)
 
-def run_algorithm(algorithm, d1, d2, kwargs, event, iterations):
+
+def _stream_counts(algorithm, d1, d2, kwargs, event_search_space, iterations, chunk_size, seed=None, start=0):
+    """ Run the algorithm chunk by chunk and fold each chunk into the running counts of the events in the given search
+    space, the raw results are discarded after each chunk so that memory usage is bounded by the chunk size.
+    :param seed: The SeedSequence to draw from, each chunk draws from its own child sequence.
+    :param start: The index of the first iteration. Each chunk is seeded by the index of its first iteration, so that
+    the iterations can be split among processes at chunk boundaries and still give the same counts.
+    :return: numpy array of (cx, cy) for each event, see _count_events.
+    """
+    seed = seed_sequence(seed)
+    counts = np.zeros((int(np.prod([len(events) for events in event_search_space])), 2), dtype=np.int64)
+    for offset, size in zip(range(start, start + iterations, chunk_size), _chunks(iterations, chunk_size)):
+        result_d1 = _sample(algorithm, d1, kwargs, size, seed=spawn_seed(seed, offset, 0))
+        result_d2 = _sample(algorithm, d2, kwargs, size, seed=spawn_seed(seed, offset, 1))
+        if not len(result_d1) == len(result_d2) == len(event_search_space):
+            raise ValueError('Given event should have the same dimension as return value.')
+        with phase('counting'):
+            counts += _count_events(result_d1, result_d2, event_search_space)
+    return counts
+
+
+def _search_counts(algorithm, d1, d2, kwargs, iterations, chunk_size, seed, search_space=None, spill_dir=None):
+    """ Run the algorithm, generate the event search space from the results and count the iterations in the events.
+    :param search_space: The strategy to generate the search space of numerical return values, see statdp.search_spaces.
+    :param spill_dir: The directory to spill the results to, see run_algorithm. The results are kept in memory if None.
+    :return: (event search space, numpy array of (cx, cy) for each event in the search space, see _count_events)
+    """
+    if spill_dir is not None:
+        with tempfile.TemporaryDirectory(prefix='statdp-', dir=spill_dir) as directory:
+            paths_d1 = _spill_chunks(algorithm, d1, kwargs, iterations, chunk_size, spawn_seed(seed, 0),
+                                     os.path.join(directory, 'd1'))
+            paths_d2 = _spill_chunks(algorithm, d2, kwargs, iterations, chunk_size, spawn_seed(seed, 1),
+                                     os.path.join(directory, 'd2'))
+            return _spilled_results(paths_d1, paths_d2, iterations, search_space)
+    # support multiple return values, each return value is stored as a row in result_d1 / result_d2
+    # e.g if an algorithm returns (1, 1), result_d1 / result_d2 would be like
+    # [
+    #   [x, x, x, ..., x],
+    #   [x, x, x, ..., x]
+    # ]
+    result_d1 = _sample_chunks(algorithm, d1, kwargs, iterations, chunk_size, spawn_seed(seed, 0))
+    result_d2 = _sample_chunks(algorithm, d2, kwargs, iterations, chunk_size, spawn_seed(seed, 1))
+    return _search_results(result_d1, result_d2, iterations, search_space)
+
+
+def _search_results(result_d1, result_d2, iterations, search_space=None):
+    """ Generate the event search space from the results of both inputs and count the iterations in the events.
+    :return: (event search space, numpy array of (cx, cy) for each event in the search space, see _count_events)
+    """
+    if len(result_d1) != len(result_d2):
+        raise ValueError('Algorithm should return the same number of values on both inputs.')
+    with phase('search space'):
+        event_search_space = _search_space(result_d1, result_d2, iterations, search_space)
+    logger.debug('search space is set to {}'.format(' × '.join(str(event) for event in event_search_space)))
+    with phase('counting'):
+        return event_search_space, _count_events(result_d1, result_d2, event_search_space)
+
+
+def _spill_chunks(algorithm, database, kwargs, iterations, chunk_size, seed, path):
+    """ Run the algorithm chunk by chunk like _sample_chunks, but append the results of each chunk to .npy files on disk
+    rather than keeping them in memory, so that the memory usage is bounded by the chunk size.
+    :param path: The path prefix of the files, the results of the i-th return value are written to `{path}.{i}.npy`.
+    :return: tuple of the paths of the files, one for each return value, see _spilled_blocks.
+    """
+    paths, files, dtypes = (), (), ()
+    try:
+        for index, size in enumerate(_chunks(iterations, chunk_size)):
+            result = _sample(algorithm, database, kwargs, size, seed=spawn_seed(seed, index))
+            with phase('spill'):
+                if not files:
+                    # the header is written for all iterations and the chunks are appended to it as they complete
+                    dtypes = tuple(row.dtype for row in result)
+                    if any(dtype.hasobject for dtype in dtypes):
+                        raise ValueError('Cannot spill results of types {}'.format(dtypes))
+                    paths = tuple('{}.{}.npy'.format(path, row) for row in range(len(result)))
+                    files = tuple(open(row_path, 'wb') for row_path in paths)
+                    for file, dtype in zip(files, dtypes):
+                        header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                                  'shape': (iterations, )}
+                        np.lib.format.write_array_header_1_0(file, header)
+                if len(result) != len(files):
+                    raise ValueError('Algorithm should return the same number of values in each chunk.')
+                for file, dtype, row in zip(files, dtypes, result):
+                    if not np.can_cast(row.dtype, dtype):
+                        raise ValueError('Cannot spill results of type {} to {}'.format(row.dtype, dtype))
+                    file.write(np.ascontiguousarray(row, dtype=dtype).tobytes())
+    finally:
+        for file in files:
+            file.close()
+    return paths
+
+
+def _spilled_blocks(paths, block_size):
+    """ Read the spilled results (see _spill_chunks) in blocks of :block_size: iterations. Each block is memory-mapped
+    on its own and copied out, so that the resident memory is bounded by the block size rather than the file size.
+    :return: generator of tuple of numpy arrays, one for each return value.
+    """
+    # the offset of the data and the type of each file, the mappings of the whole files are closed right away
+    layouts = []
+    for path in paths:
+        row = np.load(path, mmap_mode='r')
+        layouts.append((row.offset, row.dtype, len(row)))
+        del row
+    iterations = layouts[0][2] if layouts else 0
+    for start in range(0, iterations, block_size):
+        size = min(block_size, iterations - start)
+        yield tuple(np.array(np.memmap(path, dtype=dtype, mode='r', offset=offset + start * dtype.itemsize,
+                                       shape=(size, )))
+                    for path, (offset, dtype, _) in zip(paths, layouts))
+
+
+def _spilled_search_space(paths_d1, paths_d2, iterations, strategy=None, block_size=BLOCK_SIZE):
+    # generate the search space of the spilled results block by block, the same as _search_space unless there are more
+    # than _MAX_SUMMARY results of both inputs, in which case the strategy gets every k-th value of each sorted block
+    strategy = densest if strategy is None else strategy
+    stride = -(-2 * iterations // _MAX_SUMMARY)
+    uniques, summaries = [None] * len(paths_d1), [[] for _ in paths_d1]
+    for paths in (paths_d1, paths_d2):
+        for block in _spilled_blocks(paths, block_size):
+            for row, values in enumerate(block):
+                # the distinct values are only kept while the return value can still be categorical
+                if uniques[row] is not False:
+                    uniques[row] = np.unique(values) if uniques[row] is None else np.union1d(uniques[row], values)
+                    if len(uniques[row]) >= iterations * 0.002:
+                        uniques[row] = False
+                values.sort()
+                summaries[row].append(values[stride // 2::stride].copy())
+    event_search_space = []
+    for unique, summary in zip(uniques, summaries):
+        if unique is not False:
+            event_search_space.append(tuple(int(key) for key in unique))
+        else:
+            summary = np.concatenate(summary)
+            summary.sort()
+            event_search_space.append(tuple(strategy(summary)))
+    return tuple(event_search_space)
+
+
+def _spilled_results(paths_d1, paths_d2, iterations, search_space=None, block_size=BLOCK_SIZE):
+    """ Generate the event search space from the spilled results of both inputs (see _spill_chunks) and count the
+    iterations in the events, reading the files block by block.
+    :return: (event search space, numpy array of (cx, cy) for each event in the search space, see _count_events)
+    """
+    if len(paths_d1) != len(paths_d2):
+        raise ValueError('Algorithm should return the same number of values on both inputs.')
+    with phase('search space'):
+        event_search_space = _spilled_search_space(paths_d1, paths_d2, iterations, search_space, block_size)
+    logger.debug('search space is set to {}'.format(' × '.join(str(event) for event in event_search_space)))
+    counts = np.zeros((int(np.prod([len(events) for events in event_search_space])), 2), dtype=np.int64)
+    for block_d1, block_d2 in zip(_spilled_blocks(paths_d1, block_size), _spilled_blocks(paths_d2, block_size)):
+        with phase('counting'):
+            counts += _count_events(block_d1, block_d2, event_search_space)
+    return event_search_space, counts
+
+
+class EventCounts:
+    """ The counts of the events of multiple inputs in index form: one row of counts for each (input, event), where the
+    event is identified by its index in the product of the search space of the input. The search space is stored once
+    per input and the (d1, d2, kwargs, event) tuple is only built for the requested rows, see :meth:`pair`. """
+
+    def __init__(self, inputs, search_spaces, counts):
+        """
+        :param inputs: list of (d1, d2, kwargs) inputs.
+        :param search_spaces: The event search space of each input.
+        :param counts: The numpy array of (cx, cy) for each event in the search space of each input, see _count_events.
+        """
+        self.inputs, self.search_spaces = list(inputs), list(search_spaces)
+        sizes = [len(input_counts) for input_counts in counts]
+        self.input_ids = np.repeat(np.arange(len(sizes)), sizes)
+        self.event_ids = np.concatenate([np.arange(size) for size in sizes]) if sizes else np.zeros(0, dtype=np.int64)
+        # (larger count, smaller count) for each row, the order the p-values are computed in
+        self.counts = np.sort(np.concatenate(counts), axis=1)[:, ::-1] if sizes else np.zeros((0, 2), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def event(self, input_id, event_id):
+        """ Build the event with index :event_id: in the search space of input :input_id:. """
+        search_space = self.search_spaces[input_id]
+        indices = np.unravel_index(event_id, tuple(len(events) for events in search_space))
+        return tuple(events[int(index)] for events, index in zip(search_space, indices))
+
+    def pair(self, row):
+        """
+        :return: (d1, d2, kwargs, event) of the row.
+        """
+        input_id, event_id = int(self.input_ids[row]), int(self.event_ids[row])
+        d1, d2, kwargs = self.inputs[input_id]
+        return d1, d2, kwargs, self.event(input_id, event_id)
+
+
+def run_algorithm(algorithm, d1, d2, kwargs, event, iterations, chunk_size=CHUNK_SIZE, seed=None, profiler=None,
+                  search_space=None, cache=None, spill_dir=None):
     """ Run the algorithm for :iteration: times, count and return the number of iterations in :event:,
     event search space is auto-generated if not specified.
-    :param algorithm: The algorithm to run.
+    :param algorithm: The algorithm to run, batched algorithms (see :func:`batched`) are run in a single call per chunk.
+    Algorithms taking an `rng` keyword argument are given a numpy.random.Generator to draw from, the others draw from
+    the legacy global numpy random state reseeded for each chunk, so they cannot run on thread executors.
     :param d1: The D1 input to run.
     :param d2: The D2 input to run.
     :param kwargs: The keyword arguments for the algorithm.
     :param event: The event to test, auto generate event search space if None.
     :param iterations: The iterations to run.
+    :param chunk_size: The iterations to run in one chunk, if :event: is given, the results are counted and discarded
+    chunk by chunk so that memory usage is bounded by the chunk size rather than the iterations.
+    :param seed: The seed (int or numpy.random.SeedSequence) for reproducible results, fresh entropy is used if None.
+    :param profiler: The statdp.Profiler to record the time of each phase to, not profiled if None.
+    :param search_space: The strategy to generate the event search space of numerical return values if :event: is None,
+    see statdp.search_spaces, statdp.search_spaces.densest is used if None.
+    :param cache: The statdp.SampleCache to draw the samples from and add them to, only used if :seed: is given.
+    :param spill_dir: The directory to write the results to if :event: is None, for iterations whose results do not fit
+    in memory. The results are appended to temporary files chunk by chunk, and the search space and the counts are
+    computed from the files block by block (see BLOCK_SIZE). The search space is generated from a summary of the results
+    if there are more than 2 ** 21 iterations, the counts are exact. The results are kept in memory if None.
     :return: [(cx, cy), ...], [(d1, d2, kwargs, event), ...]
     """
-    if not callable(algorithm):
-        raise ValueError('Algorithm must be callable')
-    np.random.seed()
-    # support multiple return values, each return value is stored as a row in result_d1 / result_d2
-    # e.g if an algorithm returns (1, 1), result_d1 / result_d2 would be like
-    # [
-    #   [x, x, x, ..., x],
-    #   [x, x, x, ..., x]
-    # ]
+    with profiling(profiler), caching(cache, seed):
+        if not callable(algorithm):
+            raise ValueError('Algorithm must be callable')
+        seed = seed_sequence(seed)
 
-    # get return type by a sample run
-    sample_result = algorithm(d1, **kwargs)
-    if np.issubdtype(type(sample_result), np.number):
-        result_d1 = (np.fromiter((algorithm(d1, **kwargs) for _ in range(iterations)),
-                                 dtype=type(sample_result), count=iterations), )
-        result_d2 = (np.fromiter((algorithm(d2, **kwargs) for _ in range(iterations)),
-                                 dtype=type(sample_result), count=iterations), )
-    elif isinstance(sample_result, (tuple, list)):
-        # run the algorithm and store the corresponding return value into vanilla python list first
-        result_d1, result_d2 = tuple([] for _ in range(len(sample_result))),  tuple([] for _ in range(len(sample_result)))
-        for _ in range(iterations):
-            out_1 = algorithm(d1, **kwargs)
-            out_2 = algorithm(d2, **kwargs)
-            for row, (value_1, value_2) in enumerate(zip(out_1, out_2)):
-                result_d1[row].append(value_1)
-                result_d2[row].append(value_2)
-
-        # convert the python list to numpy array
-        result_d1 = tuple(np.asarray(row) for row in result_d1)
-        result_d2 = tuple(np.asarray(row) for row in result_d2)
-    else:
-        raise ValueError('Unsupported return type: {}'.format(type(sample_result)))
+        if event is None:
+            event_search_space, event_counts = _search_counts(algorithm, d1, d2, kwargs, iterations, chunk_size, seed,
+                                                               search_space, spill_dir)
+        else:
+            # if `event` is given, it should have the corresponding events for each return value,
+            # here we carefully construct the search space in the following format:
+            # [first_event] × [second_event] × [third_event] × ... × [last_event]
+            # so that when the search begins, only one possible combination can happen which is the given event
+            event_search_space = tuple((separate_event, ) for separate_event in event)
+            event_counts = _stream_counts(algorithm, d1, d2, kwargs, event_search_space, iterations, chunk_size, seed)
 
-    # get desired search space for each return value
-    event_search_space = []
-    if event is None:
-        for row in range(len(result_d1)):
-            # determine the event search space based on the return type
-            combined_result = np.concatenate((result_d1[row], result_d2[row]))
-            unique = np.unique(combined_result)
-
-            # categorical output
-            if len(unique) < iterations * 0.002:
-                event_search_space.append(tuple(int(key) for key in unique))
-            else:
-                combined_result.sort()
-                # find the densest 70% range
-                search_range = int(0.7 * len(combined_result))
-                search_max = min(range(search_range, len(combined_result)),
-                                 key=lambda x: combined_result[x] - combined_result[x - search_range])
-                search_min = search_max - search_range
-
-                event_search_space.append(
-                    tuple((-float('inf'), float(alpha)) for alpha in
-                          np.linspace(combined_result[search_min], combined_result[search_max], num=10)))
-
-        logger.debug('search space is set to {}'.format(' × '.join(str(event) for event in event_search_space)))
-    else:
-        # if `event` is given, it should have the corresponding events for each return value
-        if len(event) != len(result_d1):
-            raise ValueError('Given event should have the same dimension as return value.')
-        # here if the event is given, we carefully construct the search space in the following format:
-        # [first_event] × [second_event] × [third_event] × ... × [last_event]
-        # so that when the search begins, only one possible combination can happen which is the given event
-        event_search_space = ((separate_event, ) for separate_event in event)
-
-    counts, input_event_pairs = [], []
-    for event in itertools.product(*event_search_space):
-        cx_check, cy_check = np.full(iterations, True, dtype=np.bool), np.full(iterations, True, dtype=np.bool)
-        # check for all events in the return values
-        for row in range(len(result_d1)):
-            if np.issubdtype(type(event[row]), np.number):
-                cx_check = np.logical_and(cx_check, result_d1[row] == event[row])
-                cy_check = np.logical_and(cy_check, result_d2[row] == event[row])
-            else:
-                cx_check = np.logical_and(cx_check, np.logical_and(result_d1[row] > event[row][0],
-                                                                   result_d1[row] < event[row][1]))
-                cy_check = np.logical_and(cy_check, np.logical_and(result_d2[row] > event[row][0],
-                                                                   result_d2[row] < event[row][1]))
-
-        cx, cy = np.count_nonzero(cx_check), np.count_nonzero(cy_check)
-        counts.append((cx, cy) if cx > cy else (cy, cx))
-        input_event_pairs.append((d1, d2, kwargs, event))
-    return counts, input_event_pairs
+        counts, input_event_pairs = [], []
+        for event, (cx, cy) in zip(itertools.product(*event_search_space), event_counts.tolist()):
+            counts.append((cx, cy) if cx > cy else (cy, cx))
+            input_event_pairs.append((d1, d2, kwargs, event))
+        return counts, input_event_pairs
@@ -0,0 +1,394 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import collections
+import functools
+import itertools
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+from statdp.cache import active_cache, cached
+from statdp.profiler import active
+
+logger = logging.getLogger(__name__)
+
+# whether the current thread runs the tasks of a thread executor, see in_thread_pool
+_local = threading.local()
+
+
+def imap_unordered(executor, func, iterable):
+    """ Run func on each item of :iterable: with the executor and yield the results as they complete.
+    :param executor: A statdp executor, a multiprocessing.Pool / statdp.Session, or None to run in this process.
+    """
+    if executor is None:
+        return map(func, iterable)
+    # the workers draw from (and add to) the same sample cache
+    cache = active_cache()
+    if cache is not None:
+        func = functools.partial(cached, cache, func)
+    profiler = active()
+    if profiler is not None:
+        return profiler.imap_unordered(executor, func, iterable)
+    return executor.imap_unordered(func, iterable)
+
+
+def in_thread_pool():
+    """ Whether the current thread is a worker of a thread executor, i.e., it shares the global state (e.g., the legacy
+    numpy random state) with the other workers. """
+    return getattr(_local, 'thread_pool', False)
+
+
+def _run_in_thread(func, item):
+    # run func(item) in a worker thread of FuturesExecutor, marked for in_thread_pool
+    _local.thread_pool = True
+    try:
+        return func(item)
+    finally:
+        _local.thread_pool = False
+
+
+def is_local(executor):
+    """ Whether the workers of the executor run on this host, see shares_memory. """
+    # a multiprocessing.Pool can only exist if its module is imported, check without importing it
+    pool = sys.modules.get('multiprocessing.pool')
+    return (pool is not None and isinstance(executor, pool.Pool)) or getattr(executor, 'local', False)
+
+
+def shares_memory(executor):
+    """ Whether the workers of the executor can pass arrays back through shared memory (see share_array), i.e., they
+    run on this host and multiprocessing.shared_memory is available (Python 3.8+). The arrays are pickled otherwise. """
+    return sys.version_info >= (3, 8) and is_local(executor)
+
+
+def share_array(array):
+    """ Copy :array: into a new shared memory block, which is handed over to the process calling collect_array.
+    :return: (name, shape, dtype) of the block, which is small to pickle regardless of the size of the array.
+    """
+    from multiprocessing import resource_tracker, shared_memory
+    array = np.ascontiguousarray(array)
+    # the collecting process unlinks the block, it is not tracked here so that it is not removed when this worker exits
+    if sys.version_info >= (3, 13):
+        block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes), track=False)
+    else:
+        block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        # the blocks are only tracked on POSIX, under the name with the leading slash that `name` strips
+        if os.name == 'posix':
+            resource_tracker.unregister('/' + block.name, 'shared_memory')
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    block.close()
+    return block.name, array.shape, array.dtype.str
+
+
+def collect_array(handle):
+    """ Copy the array out of the shared memory block created by share_array and free the block. """
+    from multiprocessing import shared_memory
+    name, shape, dtype = handle
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return np.ndarray(shape, dtype=dtype, buffer=block.buf).copy()
+    finally:
+        block.close()
+        block.unlink()
+
+
+class Executor:
+    """ The interface of the backends that run the tasks of select_event and hypothesis_test, any object with the same
+    `imap_unordered` method (e.g., multiprocessing.Pool or statdp.Session) can be used in place of an executor. """
+
+    # the number of workers, used to split the iterations into chunks
+    processes = 1
+    # whether the workers run on this host, see is_local
+    local = False
+
+    def imap_unordered(self, func, iterable):
+        """ Run func on each item of :iterable: and yield the results in the order they complete. """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def terminate(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+
+class FuturesExecutor(Executor):
+    """ Executor backed by a concurrent.futures.Executor. With a ThreadPoolExecutor, the algorithms must take an `rng`
+    argument, since the legacy global numpy random state is shared by the threads (see statdp.core.run_algorithm). """
+
+    local = True
+
+    def __init__(self, executor=None, processes=0):
+        """
+        :param executor: The concurrent.futures.Executor to submit the tasks to, a ProcessPoolExecutor with
+        :processes: workers is created (and shut down on close) if None.
+        :param processes: The number of worker processes, 0 means auto-detection, not used if :executor: is given.
+        """
+        self._owned = executor is None
+        if executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self.processes = os.cpu_count() if processes == 0 else processes
+            executor = ProcessPoolExecutor(self.processes)
+        else:
+            self.processes = getattr(executor, '_max_workers', None) or os.cpu_count()
+        from concurrent.futures import ThreadPoolExecutor
+        self._executor, self._threads = executor, isinstance(executor, ThreadPoolExecutor)
+
+    def imap_unordered(self, func, iterable):
+        import concurrent.futures
+        if self._threads:
+            func = functools.partial(_run_in_thread, func)
+        # keep a bounded number of tasks in flight so that a long iterable is not submitted all at once
+        iterator = iter(iterable)
+        pending = {self._executor.submit(func, item) for item in itertools.islice(iterator, 2 * self.processes)}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            pending |= {self._executor.submit(func, item) for item in itertools.islice(iterator, len(done))}
+            for future in done:
+                yield future.result()
+
+    def close(self):
+        if self._owned:
+            self._executor.shutdown(wait=True)
+
+    def terminate(self):
+        if self._owned:
+            # the pending tasks can only be cancelled from Python 3.9
+            self._executor.shutdown(wait=False, **({'cancel_futures': True} if sys.version_info >= (3, 9) else {}))
+
+
+def run_worker(address, authkey):
+    """ Connect to a WorkQueueExecutor at :address: and run the tasks it sends until it closes the connection.
+    The worker needs statdp and the module of the algorithm to be importable, since the tasks are pickled.
+    """
+    from multiprocessing.connection import Client
+    with Client(tuple(address), authkey=authkey) as connection:
+        while True:
+            try:
+                message = connection.recv()
+            except EOFError:
+                return
+            if message is None:
+                return
+            task_id, func, item = message
+            try:
+                response = (task_id, True, func(item))
+            except Exception as e:
+                response = (task_id, False, e)
+            try:
+                connection.send(response)
+            except Exception as e:
+                # the exception (or the result) may not be picklable
+                connection.send((task_id, False, RuntimeError(repr(e))))
+
+
+class WorkQueueExecutor(Executor):
+    """ Executor that hands the tasks out over sockets to workers on this or other hosts, the workers are started by
+    `STATDP_AUTHKEY=... python -m statdp.worker HOST:PORT` (or run_worker / start_workers) and can join at any time.
+    Each worker runs one task at a time, and the tasks of a worker that disconnects are handed out again. The tasks
+    and the results are pickled, so anyone with the key can run code on the workers and on this process: keep the key
+    secret and only listen on trusted networks. """
+
+    def __init__(self, address=('127.0.0.1', 0), authkey=None, timeout=60):
+        """
+        :param address: The (host, port) to listen on, port 0 picks a free port, see :address: attribute.
+        :param authkey: The key (bytes) the workers need to connect, a random key is generated if None, see :authkey:
+        attribute.
+        :param timeout: The seconds to wait for a worker to connect while there are tasks and no workers, after which
+        imap_unordered raises TimeoutError. Waits forever if None.
+        """
+        from multiprocessing.connection import Listener
+        authkey = os.urandom(32) if authkey is None else authkey
+        self._listener = Listener(tuple(address), authkey=authkey)
+        self.address, self.authkey, self.timeout = self._listener.address, authkey, timeout
+        self._tasks = queue.Queue()
+        self._results = {}
+        self._task_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed, self._terminated = False, False
+        self._workers = []
+        self._threads = []
+        self.completed = collections.Counter()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    @property
+    def processes(self):
+        # the scheduler splits the work by the workers connected when the tasks are created, at least one
+        with self._lock:
+            return max(1, len(self._workers))
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+                worker = self._listener.last_accepted
+            except Exception:
+                # the listener is closed, or a client failed the authentication
+                if self._closed:
+                    return
+                logger.warning('failed to accept a worker', exc_info=True)
+                continue
+            with self._lock:
+                if self._closed:
+                    # the executor is closed while accepting the worker, stop it right away
+                    connection.send(None)
+                    connection.close()
+                    return
+                self._workers.append(connection)
+                thread = threading.Thread(target=self._serve, args=(connection, worker), daemon=True)
+                self._threads.append(thread)
+            logger.debug('worker connected from {}'.format(worker))
+            thread.start()
+
+    def _serve(self, connection, worker):
+        # hand the tasks to a connected worker one at a time
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    try:
+                        connection.send(None)
+                    except OSError:
+                        # the connection is shut down by terminate
+                        pass
+                    return
+                results, task_id, func, item = task
+                if results.cancelled:
+                    continue
+                try:
+                    connection.send((task_id, func, item))
+                    _, success, result = connection.recv()
+                except (EOFError, OSError):
+                    if self._terminated:
+                        return
+                    # the worker is gone, give the task to another one
+                    logger.warning('worker {} disconnected, rescheduling its task'.format(worker))
+                    self._tasks.put(task)
+                    return
+                with self._lock:
+                    self.completed[worker] += 1
+                results.put((success, result))
+        finally:
+            with self._lock:
+                self._workers.remove(connection)
+            connection.close()
+
+    def imap_unordered(self, func, iterable):
+        if self._closed:
+            raise ValueError('executor is closed')
+        results = queue.Queue()
+        results.cancelled = False
+        count = 0
+        for item in iterable:
+            self._tasks.put((results, next(self._task_ids), func, item))
+            count += 1
+        try:
+            for _ in range(count):
+                success, result = self._wait(results)
+                if not success:
+                    raise result
+                yield result
+        finally:
+            # the remaining tasks are skipped by the workers if the results are no longer consumed
+            results.cancelled = True
+
+    def _wait(self, results):
+        # wait for the next result, as long as a worker is connected or has been within the timeout
+        idle = None
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                pass
+            with self._lock:
+                connected = len(self._workers) > 0
+            idle = None if connected else (idle if idle is not None else time.monotonic())
+            if idle is not None and self.timeout is not None and time.monotonic() - idle > self.timeout:
+                raise TimeoutError('no worker connected to {} for {} seconds'.format(self.address, self.timeout))
+
+    def close(self):
+        """ Stop the workers after the queued tasks and stop accepting new workers. """
+        with self._lock:
+            self._closed = True
+            workers = len(self._workers)
+        for _ in range(workers):
+            self._tasks.put(None)
+        self._listener.close()
+
+    def terminate(self):
+        """ Drop the queued tasks, stop the workers and wait for the threads serving them. """
+        with self._lock:
+            self._closed, self._terminated = True, True
+            workers, threads = list(self._workers), list(self._threads)
+        while True:
+            try:
+                self._tasks.get_nowait()
+            except queue.Empty:
+                break
+        # the threads waiting for a task stop their worker, the ones waiting for a result are woken by the shutdown
+        for _ in workers:
+            self._tasks.put(None)
+        for connection in workers:
+            _shutdown(connection)
+        for thread in threads:
+            thread.join(timeout=1)
+        for connection in workers:
+            connection.close()
+        self._listener.close()
+
+
+def _shutdown(connection):
+    # wake up the threads blocked in connection.recv, closing the connection does not interrupt them
+    import socket
+    try:
+        with socket.fromfd(connection.fileno(), socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def start_workers(address, authkey, processes=0):
+    """ Start local worker processes for a WorkQueueExecutor at :address:.
+    :param authkey: The key of the executor, see WorkQueueExecutor.authkey.
+    :param processes: The number of worker processes, 0 means auto-detection.
+    :return: list of the started multiprocessing.Process.
+    """
+    import multiprocessing as mp
+    processes = os.cpu_count() if processes == 0 else processes
+    workers = [mp.Process(target=run_worker, args=(address, authkey), daemon=True) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    return workers
+
@@ -19,9 +19,10 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-import logging
-import math
 import enum
+import logging
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -51,6 +52,25 @@ def generate_arguments(algorithm, d1, d2, default_kwargs):
     return default_kwargs
 
 
+def _patterns(num_input, sensitivity):
+    # the fixed (d1, d2) patterns as numpy arrays, assume maximum distance is 1
+    half, ones = num_input // 2, np.ones(num_input, dtype=np.int64)
+
+    def pattern(first, rest, split=1):
+        return np.concatenate((np.full(split, first, dtype=np.int64), np.full(num_input - split, rest, dtype=np.int64)))
+
+    yield ones, pattern(0, 1)  # one below
+    yield ones, pattern(2, 1)  # one above
+
+    if sensitivity == ALL_DIFFER:
+        yield ones, pattern(2, 0)  # one above rest below
+        yield ones, pattern(0, 2)  # one below rest above
+        yield ones, pattern(2, 0, half)  # half half
+        yield ones, np.full(num_input, 2, dtype=np.int64)  # all above
+        yield ones, np.zeros(num_input, dtype=np.int64)  # all below
+        yield pattern(1, 0, half), pattern(0, 1, half)  # x shape
+
+
 def generate_databases(algorithm, num_input, default_kwargs, sensitivity=ALL_DIFFER):
     """
     :param algorithm: The algorithm to test for.
@@ -62,24 +82,66 @@ def generate_databases(algorithm, num_input, default_kwargs, sensitivity=ALL_DIF
     if not isinstance(sensitivity, Sensitivity):
         raise ValueError('sensitivity must be statdp.ALL_DIFFER or statdp.ONE_DIFFER')
 
-    # assume maximum distance is 1
-    d1 = [1 for _ in range(num_input)]
-    candidates = [
-        (d1, [0] + [1 for _ in range(num_input - 1)]),  # one below
-        (d1, [2] + [1 for _ in range(num_input - 1)]),  # one above
-    ]
+    return tuple((d1.tolist(), d2.tolist(), generate_arguments(algorithm, d1, d2, default_kwargs))
+                 for d1, d2 in _patterns(num_input, sensitivity))
 
+
+def _random_pair(num_input, sensitivity, rng):
+    # a random database with queries in [0, 2] and a random neighbor of it
+    d1 = rng.integers(0, 3, num_input)
     if sensitivity == ALL_DIFFER:
-        candidates.extend([
-            (d1, [2] + [0 for _ in range(num_input - 1)]),  # one above rest below
-            (d1, [0] + [2 for _ in range(num_input - 1)]),  # one below rest above
-            # half half
-            (d1, [2 for _ in range(int(num_input / 2))] + [0 for _ in range(num_input - int(num_input / 2))]),
-            (d1, [2 for _ in range(num_input)]),  # all above
-            (d1, [0 for _ in range(num_input)]),  # all below
-            # x shape
-            ([1 for _ in range(int(math.floor(num_input / 2.0)))] + [0 for _ in range(int(math.ceil(num_input / 2.0)))],
-             [0 for _ in range(int(math.floor(num_input / 2.0)))] + [1 for _ in range(int(math.ceil(num_input / 2.0)))])
-        ])
-
-    return tuple((d1, d2, generate_arguments(algorithm, d1, d2, default_kwargs)) for d1, d2 in candidates)
+        # d2 is redrawn if it equals d1
+        difference = rng.integers(-1, 2, num_input)
+        while not difference.any():
+            difference = rng.integers(-1, 2, num_input)
+        return d1, d1 + difference
+    d2 = d1.copy()
+    d2[rng.integers(num_input)] += rng.choice((-1, 1))
+    return d1, d2
+
+
+def _local_pair(d1, d2, sensitivity, rng):
+    # a neighbor of the (d1, d2) pair: a few queries of d1 are moved by one, and under ALL_DIFFER a few differences
+    # are redrawn while under ONE_DIFFER the difference is moved to another query
+    d1, difference = np.array(d1, dtype=np.int64), np.asarray(d2, dtype=np.int64) - np.asarray(d1, dtype=np.int64)
+    changes = rng.integers(1, max(1, len(d1) // 10) + 1)
+    d1[rng.integers(len(d1), size=changes)] += rng.choice((-1, 1), size=changes)
+    if sensitivity == ALL_DIFFER:
+        redrawn = difference.copy()
+        redrawn[rng.integers(len(d1), size=changes)] = rng.integers(-1, 2, size=changes)
+        # the differences are kept if redrawing them would make d2 equal to d1
+        difference = redrawn if redrawn.any() else difference
+    else:
+        difference = np.roll(difference, rng.integers(len(d1)))
+    return d1, d1 + difference
+
+
+def stream_databases(algorithm, num_input, default_kwargs, sensitivity=ALL_DIFFER, candidates=64, seed=None):
+    """ Lazily generate candidate inputs as numpy arrays, for each length in :num_input: the fixed patterns of
+    generate_databases are followed by randomized pairs until :candidates: inputs are generated for the length. Only the
+    current candidate is kept in memory, so the inputs can be consumed in bounded batches (see select_event).
+    A (d1, d2, kwargs) input sent to the generator (e.g., the best input so far) is taken as the center of a local
+    search: from then on every other randomized pair of the same length is a neighbor of it instead, with a few queries
+    changed. Inputs of other lengths are ignored, and the local search starts afresh for each length.
+    :param algorithm: The algorithm to test for.
+    :param num_input: The number of queries of the inputs, or a tuple of them.
+    :param default_kwargs: The default arguments that are given or have a default value.
+    :param sensitivity: The sensitivity setting, all queries can differ by one or just one query can differ by one.
+    :param candidates: The number of inputs to generate for each length.
+    :param seed: The seed (int or numpy.random.SeedSequence) of the randomized pairs, fresh entropy if None.
+    :return: generator of (d1, d2, args).
+    """
+    if not isinstance(sensitivity, Sensitivity):
+        raise ValueError('sensitivity must be statdp.ALL_DIFFER or statdp.ONE_DIFFER')
+    rng = np.random.default_rng(seed)
+    for num in ((int(num_input), ) if isinstance(num_input, (int, float)) else num_input):
+        patterns, center = _patterns(num, sensitivity), None
+        for index in range(candidates):
+            pair = next(patterns, None)
+            if pair is None:
+                pair = _local_pair(center[0], center[1], sensitivity, rng) if center is not None and index % 2 == 0 \
+                    else _random_pair(num, sensitivity, rng)
+            d1, d2 = pair
+            feedback = yield d1, d2, generate_arguments(algorithm, d1, d2, default_kwargs)
+            if feedback is not None and len(feedback[0]) == num:
+                center = feedback
@@ -20,13 +20,17 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import functools
+import itertools
 import logging
 import math
-import multiprocessing as mp
+import warnings
 
 import numpy as np
 
-from statdp.core import run_algorithm
+from statdp.cache import caching
+from statdp.core import CHUNK_SIZE, _database_key, _stream_counts, epsilon_key, seed_sequence, spawn_seed
+from statdp.profiler import phase, profiling
+from statdp.scheduler import ChunkScheduler, pool_size
 import statdp._hypergeom as hypergeom
 
 logger = logging.getLogger(__name__)
@@ -34,33 +38,128 @@ logger = logging.getLogger(__name__)
 
 def _hypergeometric(cx, cy, iterations):
     # here we use `cx - 1` because pvalue should be P(random variable >= test_statistic) rather than > test_statistic
-    return 1 - hypergeom.cdf(cx - 1, 2 * iterations, iterations, cx + cy)
+    return hypergeom.sf_many(np.asarray(cx) - 1, 2 * iterations, iterations, np.asarray(cx) + cy)
 
 
-def test_statistics(cx, cy, epsilon, iterations, process_pool=None):
+# the number of standard deviations around the mean of the binomial distribution summed over by the exact p-value
+_BINOMIAL_WIDTH = 12
+
+
+def _binomial(n, p):
+    """ The (truncated) support and probability mass function of Binomial(n, p), the mass outside of
+    _BINOMIAL_WIDTH standard deviations around the mean is negligible and left out.
+    :return: (ks, pmf) numpy arrays.
+    """
+    if n == 0 or p <= 0 or p >= 1:
+        return np.asarray([0 if p <= 0 else n]), np.ones(1)
+    mean, width = n * p, _BINOMIAL_WIDTH * math.sqrt(n * p * (1 - p)) + _BINOMIAL_WIDTH
+    ks = np.arange(max(0, int(mean - width)), min(n, int(math.ceil(mean + width))) + 1)
+    log_pmf = hypergeom.log_choose(n, ks) + ks * math.log(p) + (n - ks) * math.log1p(-p)
+    pmf = np.exp(log_pmf - log_pmf.max())
+    return ks, pmf / pmf.sum()
+
+
+def test_statistics(cx, cy, epsilon, iterations, process_pool=None, seed=None, exact=True):
     """ Calculate p-value based on observed results.
     :param cx: The observed count of running algorithm with database 1 that falls into the event
     :param cy:The observed count of running algorithm with database 2 that falls into the event
     :param epsilon: The epsilon to test for.
     :param iterations: The total iterations for running algorithm.
-    :param process_pool: The process pool to run on, run in single core if None
+    :param process_pool: Deprecated and ignored, the p-value is evaluated in a single vectorized call.
+    :param seed: The seed (int or numpy.random.SeedSequence) for the binomial samples, fresh entropy if None. Not used
+    if :exact: is True.
+    :param exact: Compute the p-value as the exact expectation over Binomial(cx, 1 / e^epsilon), otherwise the
+    p-value is averaged over 200 samples of the binomial distribution (Monte Carlo).
     :return: p-value
     """
-    # average p value
-    sample_num = 200
-    if process_pool is None or hypergeom.use_gsl:
-        return np.fromiter((_hypergeometric(cx, cy, iterations)
-                            for cx in np.random.binomial(cx, 1.0 / (np.exp(epsilon)), sample_num)),
-                           dtype=np.float64, count=sample_num).mean()
-    else:
-        # bind cy and iterations to _hypergeometric function and feed different cx into it
-        return np.fromiter(process_pool.imap_unordered(functools.partial(_hypergeometric, cy=cy, iterations=iterations),
-                                                       np.random.binomial(cx, 1.0 / (np.exp(epsilon)), sample_num),
-                                                       chunksize=int(sample_num / mp.cpu_count())),
-                           dtype=np.float64, count=sample_num).mean()
-
-
-def hypothesis_test(algorithm, d1, d2, kwargs, event, epsilon, iterations, report_p2=True, process_pool=None):
+    if process_pool is not None:
+        warnings.warn('process_pool of test_statistics is deprecated and ignored, the p-value is evaluated in a single '
+                      'vectorized call', DeprecationWarning, stacklevel=2)
+    with phase('p-value'):
+        if exact:
+            # the p-values of the binomial support lie on the line N - k = cy + 1, evaluated from one table of sf_many
+            ks, pmf = _binomial(int(cx), 1.0 / np.exp(epsilon))
+            return min(float(np.dot(pmf, _hypergeometric(ks, cy, iterations))), 1.0)
+        # average p value
+        sample_num = 200
+        rng = np.random.default_rng(seed)
+        return _hypergeometric(rng.binomial(cx, 1.0 / (np.exp(epsilon)), sample_num), cy, iterations).mean()
+
+
+def _run_search_space(algorithm, d1, d2, kwargs, event_search_space, seed, start, iterations):
+    # run the algorithm and count the iterations in the events, unlike run_algorithm the counts are kept in (d1, d2)
+    # order so that counts of different runs can be summed up
+    return _stream_counts(algorithm, d1, d2, kwargs, event_search_space, iterations, chunk_size=CHUNK_SIZE,
+                          seed=seed, start=start)
+
+
+def _run_counts(algorithm, d1, d2, kwargs, event_search_space, iterations, process_pool, seed=None, start=0):
+    """ Run the algorithm for :iterations: times on the process pool (if any) and count the iterations in the events.
+    The samples are seeded by chunks of CHUNK_SIZE iterations from :start:, so the counts are the same no matter how
+    the iterations are split among the workers.
+    :return: numpy array of (cx, cy) for each event in the search space, see statdp.core._count_events.
+    """
+    seed = seed_sequence(seed)
+    if process_pool is None:
+        return _run_search_space(algorithm, d1, d2, kwargs, event_search_space, seed, start, iterations)
+
+    # the session keeps its scheduler so that the throughput of its workers is accumulated across calls
+    scheduler = getattr(process_pool, 'scheduler', None) or ChunkScheduler(pool_size(process_pool))
+    # start the pool to run the algorithm and collects the statistics
+    return sum(scheduler.run(process_pool, functools.partial(_run_search_space, algorithm, d1, d2, kwargs,
+                                                             event_search_space, seed), iterations,
+                             granularity=CHUNK_SIZE, start=start))
+
+
+def _run_event(algorithm, d1, d2, kwargs, event, iterations, process_pool, seed=None, start=0):
+    (cx, cy), = _run_counts(algorithm, d1, d2, kwargs, tuple((separate_event, ) for separate_event in event),
+                            iterations, process_pool, seed, start).tolist()
+    return cx, cy
+
+
+def _ratio_upper_bound(cx, cy, confidence):
+    # Clopper-Pearson upper confidence bound of P[M(D1) in E] / P[M(D2) in E], given cx + cy iterations in the event,
+    # cx follows Binomial(cx + cy, r / (1 + r)) with r being the ratio
+    if cy == 0:
+        return float('inf')
+    from scipy.stats import beta
+    upper = beta.ppf(confidence, cx + 1, cy)
+    return upper / (1 - upper) if upper < 1 else float('inf')
+
+
+def _sequential_test(algorithm, d1, d2, kwargs, event, epsilon, iterations, report_p2, process_pool, significance,
+                     seed=None):
+    """ Run the hypothesis test in rounds of doubling iterations, and stop as soon as the result is decided on all
+    reported p-values: either the p-value is already below the significance level, or the ratio between the event
+    probabilities is confidently below e^epsilon. The significance level is split evenly among the rounds.
+    :return: (p-values, iterations) where the p-values are from the counts of the first iterations.
+    """
+    rounds = [iterations]
+    while rounds[0] >= 2000:
+        rounds.insert(0, rounds[0] // 2)
+    level = significance / len(rounds)
+    seed = seed_sequence(seed)
+
+    cx, cy, used = 0, 0, 0
+    for round_index, total in enumerate(rounds):
+        # each round continues from the iterations used so far, so that it draws fresh samples from the same seed
+        local_cx, local_cy = _run_event(algorithm, d1, d2, kwargs, event, total - used, process_pool,
+                                        spawn_seed(seed, 0), used)
+        cx, cy, used = cx + local_cx, cy + local_cy, total
+        large, small = (cx, cy) if cx > cy else (cy, cx)
+        directions = ((large, small), (small, large)) if report_p2 else ((large, small), )
+        p_values = tuple(test_statistics(x, y, epsilon, used, seed=spawn_seed(seed, 1, round_index, direction))
+                         for direction, (x, y) in enumerate(directions))
+        decided = all(p <= level or _ratio_upper_bound(x, y, 1 - level) < np.exp(epsilon)
+                      for p, (x, y) in zip(p_values, directions))
+        if decided or used == iterations:
+            logger.debug('sequential test stopped after {} / {} iterations with cx: {} | cy: {}'
+                         .format(used, iterations, cx, cy))
+            return (p_values if report_p2 else p_values[0]), used
+
+
+def hypothesis_test(algorithm, d1, d2, kwargs, event, epsilon, iterations, report_p2=True, process_pool=None,
+                    sequential=False, significance=0.05, seed=None, profiler=None, cache=None):
     """ Run hypothesis tests on given input and events.
     :param algorithm: The algorithm to run on
     :param kwargs: The keyword arguments the algorithm needs
@@ -70,31 +169,66 @@ def hypothesis_test(algorithm, d1, d2, kwargs, event, epsilon, iterations, repor
     :param iterations: Number of iterations to run
     :param epsilon: The epsilon value to test for
     :param report_p2: The boolean to whether report p2 or not
-    :param process_pool: The process pool to use, run with single process if None
-    :return: p values
+    :param process_pool: The process pool (or statdp.Session / executor) to use, run with single process if None
+    :param sequential: Run the test in rounds and stop early once the result is decided at :significance: level.
+    :param significance: The significance level for the sequential test to decide on.
+    :param seed: The seed (int or numpy.random.SeedSequence) for reproducible p-values, fresh entropy if None. The
+    p-values from the same seed do not depend on the number of processes.
+    :param profiler: The statdp.Profiler to record the time of each phase to, not profiled if None.
+    :param cache: The statdp.SampleCache to draw the samples from and add them to, only used if :seed: is given.
+    :return: p values, or (p values, iterations used) if :sequential: is True
     """
-    if process_pool is None:
-        ((cx, cy), *_), _ = run_algorithm(algorithm, d1, d2, kwargs, event, iterations)
-        if report_p2:
-            return test_statistics(cx, cy, epsilon, iterations), test_statistics(cy, cx, epsilon, iterations)
-        else:
-            return test_statistics(cx, cy, epsilon, iterations)
-    else:
-        process_iterations = [int(math.floor(float(iterations) / mp.cpu_count())) for _ in range(mp.cpu_count())]
-        # add the remaining iterations to the last index
-        process_iterations[mp.cpu_count() - 1] += iterations % process_iterations[mp.cpu_count() - 1]
-
-        # start the pool to run the algorithm and collects the statistics
-        cx, cy = 0, 0
-        for ((local_cx, local_cy), *_), _ in process_pool.imap_unordered(
-                functools.partial(run_algorithm, algorithm, d1, d2, kwargs, event), process_iterations):
-            cx += local_cx
-            cy += local_cy
+    with profiling(profiler), caching(cache, seed):
+        if sequential:
+            return _sequential_test(algorithm, d1, d2, kwargs, event, epsilon, iterations, report_p2, process_pool,
+                                    significance, seed)
+
+        seed = seed_sequence(seed)
+        cx, cy = _run_event(algorithm, d1, d2, kwargs, event, iterations, process_pool, spawn_seed(seed, 0))
         cx, cy = (cx, cy) if cx > cy else (cy, cx)
 
         # calculate and return p value
         if report_p2:
-            return test_statistics(cx, cy, epsilon, iterations, process_pool), \
-                   test_statistics(cy, cx, epsilon, iterations, process_pool)
+            return (test_statistics(cx, cy, epsilon, iterations, seed=spawn_seed(seed, 1, 0)),
+                    test_statistics(cy, cx, epsilon, iterations, seed=spawn_seed(seed, 1, 1)))
         else:
-            return test_statistics(cx, cy, epsilon, iterations, process_pool)
+            return test_statistics(cx, cy, epsilon, iterations, seed=spawn_seed(seed, 1, 0))
+
+
+def hypothesis_tests(algorithm, input_event_pairs, epsilons, iterations, process_pool=None, seed=None, profiler=None,
+                     cache=None):
+    """ Run hypothesis tests for a sweep of test epsilons, the algorithm is run only once on each distinct input and
+    all events selected on the input are counted from the same samples.
+    :param algorithm: The algorithm to run on
+    :param input_event_pairs: The list of (d1, d2, kwargs, event) for each epsilon, e.g., from select_events.
+    :param epsilons: The list of test epsilon values
+    :param iterations: Number of iterations to run
+    :param process_pool: The process pool (or statdp.Session / executor) to use, run with single process if None
+    :param seed: The seed (int or numpy.random.SeedSequence) for reproducible p-values, fresh entropy if None.
+    :param profiler: The statdp.Profiler to record the time of each phase to, not profiled if None.
+    :param cache: The statdp.SampleCache to draw the samples from and add them to, only used if :seed: is given.
+    :return: p values for each epsilon
+    """
+    with profiling(profiler), caching(cache, seed):
+        seed = seed_sequence(seed)
+        # group the epsilons by input, the inputs from select_events are shared objects from the input list, each input
+        # and epsilon is seeded by its content / value so that the p-values do not depend on the other epsilons
+        inputs = {}
+        for index, (d1, d2, kwargs, event) in enumerate(input_event_pairs):
+            inputs.setdefault((id(d1), id(d2), id(kwargs)), (d1, d2, kwargs, []))[3].append((index, tuple(event)))
+
+        p_values = [None] * len(input_event_pairs)
+        for d1, d2, kwargs, indexed_events in inputs.values():
+            # count all the selected events in one run, the search space is the product of the separate events
+            event_search_space = tuple(tuple(set(separate_events))
+                                       for separate_events in zip(*(event for _, event in indexed_events)))
+            counts = dict(zip(itertools.product(*event_search_space),
+                              _run_counts(algorithm, d1, d2, kwargs, event_search_space, iterations,
+                                          process_pool, spawn_seed(seed, 0, _database_key(d1, kwargs),
+                                                                   _database_key(d2, kwargs))).tolist()))
+            for index, event in indexed_events:
+                cx, cy = counts[event]
+                cx, cy = (cx, cy) if cx > cy else (cy, cx)
+                p_values[index] = test_statistics(cx, cy, epsilons[index], iterations,
+                                                  seed=spawn_seed(seed, 1, epsilon_key(epsilons[index])))
+        return p_values
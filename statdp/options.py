@@ -0,0 +1,50 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from statdp.cache import SampleCache
+from statdp.store import ResultStore
+
+
+class ExecutionOptions:
+    """ How detect_counterexample runs, records and reuses its work, as opposed to what it detects: the pool the work
+    runs on, the store of the results, the profiler, the sample cache and the directory the samples are spilled to. """
+
+    def __init__(self, session=None, store=None, profiler=None, cache=None, spill_dir=None):
+        """
+        :param session: The statdp.Session (or executor) to run on, a new process pool is created (and closed) for
+        each detection if None.
+        :param store: The statdp.ResultStore (or the path of its file) to write each result to as soon as it completes,
+        the results already in the store are reused rather than detected again, so an interrupted detection can be
+        resumed.
+        :param profiler: The statdp.Profiler to record the time of each phase to. If given, the totals of the phases of
+        each test epsilon (see Profiler.totals) are attached to its result as the last element, the totals of the whole
+        run are shared by all epsilons for a sweep, and the stored results have None.
+        :param cache: The statdp.SampleCache (or the path of its directory) to draw the samples of the algorithm from
+        and add them to, so that the runs with the same seed reuse the samples of each other. Not used without a seed.
+        :param spill_dir: The directory to write the samples of event selection to rather than keeping them in memory,
+        for event iterations whose samples do not fit in memory, see statdp.core.run_algorithm. It must be reachable by
+        the workers of :session:. The samples are kept in memory if None.
+        """
+        self.session = session
+        self.store = ResultStore(store) if isinstance(store, str) else store
+        self.profiler = profiler
+        self.cache = SampleCache(cache) if isinstance(cache, str) else cache
+        self.spill_dir = spill_dir
@@ -0,0 +1,149 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import collections
+import contextlib
+import functools
+import pickle
+import threading
+import time
+
+# the profiler the phases are recorded to in the current thread, see profiling
+_local = threading.local()
+
+
+def active():
+    """
+    :return: The Profiler activated in the current thread, None if not profiling.
+    """
+    return getattr(_local, 'profiler', None)
+
+
+@contextlib.contextmanager
+def profiling(profiler):
+    """ Activate :profiler: in the current thread for the phases recorded in the block, no-op if :profiler: is None. """
+    if profiler is None:
+        yield None
+        return
+    previous, _local.profiler = active(), profiler
+    try:
+        yield profiler
+    finally:
+        _local.profiler = previous
+
+
+@contextlib.contextmanager
+def phase(name):
+    """ Record the wall and CPU time of the block as phase :name: to the active profiler, if any. """
+    profiler = active()
+    if profiler is None:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        profiler.record(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+
+def add_calls(calls):
+    """ Count :calls: algorithm calls (iterations) to the active profiler, if any. """
+    profiler = active()
+    if profiler is not None:
+        profiler.calls += calls
+
+
+class Profiler:
+    """ Collects the wall / CPU time of each phase of a detection (sampling, search space, counting, p-value, pool),
+    the number of algorithm calls and optionally the bytes sent to / received from the pool. The phases run in the
+    workers are recorded there and merged back, so their times are summed over the workers. """
+
+    def __init__(self, callback=None, measure_bytes=False):
+        """
+        :param callback: Called with (phase name, wall seconds, CPU seconds) each time a phase is recorded in this
+        process, e.g., to print or log the progress.
+        :param measure_bytes: Count the bytes sent to / received from the pool. The tasks and the results are pickled
+        once more to measure them, which adds to the time of the pool, so the bytes are left at 0 if False.
+        """
+        self.callback, self.measure_bytes = callback, measure_bytes
+        self.phases = collections.OrderedDict()
+        self.calls, self.bytes_sent, self.bytes_received = 0, 0, 0
+
+    def record(self, name, wall, cpu, count=1):
+        entry = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'count': 0})
+        entry['wall'] += wall
+        entry['cpu'] += cpu
+        entry['count'] += count
+        if self.callback is not None:
+            self.callback(name, wall, cpu)
+
+    def child(self):
+        """ A new profiler with the same callback and options, to be merged back with :meth:`merge`. """
+        return Profiler(self.callback, self.measure_bytes)
+
+    def merge(self, other):
+        """ Add the records of :other: (a Profiler or its :meth:`totals`) to this profiler. """
+        totals = other.totals() if isinstance(other, Profiler) else other
+        for name, entry in totals['phases'].items():
+            target = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'count': 0})
+            for field in ('wall', 'cpu', 'count'):
+                target[field] += entry[field]
+        self.calls += totals['calls']
+        self.bytes_sent += totals['bytes_sent']
+        self.bytes_received += totals['bytes_received']
+
+    def totals(self):
+        """
+        :return: dict of the wall / CPU time and count of each phase, the algorithm calls, the calls per second of
+        sampling (per process) and the bytes sent to / received from the pool.
+        """
+        sampling = self.phases.get('sampling', {}).get('wall', 0.0)
+        return {'phases': {name: dict(entry) for name, entry in self.phases.items()}, 'calls': self.calls,
+                'calls_per_second': self.calls / sampling if sampling > 0 else 0.0,
+                'bytes_sent': self.bytes_sent, 'bytes_received': self.bytes_received}
+
+    def imap_unordered(self, executor, func, iterable):
+        """ Run the tasks on the executor with the phases in the workers recorded, and the pickled bytes counted if
+        :attr:`measure_bytes` is set. """
+        def dispatch():
+            for item in iterable:
+                self.bytes_sent += len(pickle.dumps((func, item)))
+                yield item
+
+        # the time waiting for the pool, including the time the caller spends between the results
+        wall, cpu = time.perf_counter(), time.process_time()
+        tasks = dispatch() if self.measure_bytes else iterable
+        try:
+            for result, totals, size in executor.imap_unordered(functools.partial(_profiled, func, self.measure_bytes),
+                                                                tasks):
+                self.merge(totals)
+                self.bytes_received += size
+                yield result
+        finally:
+            self.record('pool', time.perf_counter() - wall, time.process_time() - cpu)
+
+
+def _profiled(func, measure_bytes, item):
+    # run the task with a local profiler and send its totals back along with the result (and its pickled size)
+    profiler = Profiler()
+    with profiling(profiler):
+        result = func(item)
+    return result, profiler.totals(), len(pickle.dumps(result)) if measure_bytes else 0
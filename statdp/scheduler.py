@@ -0,0 +1,125 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import collections
+import functools
+import itertools
+import logging
+import math
+import os
+import time
+
+from statdp.executors import imap_unordered
+
+logger = logging.getLogger(__name__)
+
+
+def pool_size(process_pool):
+    """ Get the number of workers of the pool (multiprocessing.Pool, statdp.Session or executor). """
+    processes = getattr(process_pool, 'processes', None) or getattr(process_pool, '_processes', None)
+    return processes if processes else os.cpu_count()
+
+
+def _timed_chunk(func, chunk):
+    start, iterations = chunk
+    timer = time.perf_counter()
+    result = func(start, iterations)
+    return result, os.getpid(), iterations, time.perf_counter() - timer
+
+
+class ChunkScheduler:
+    """ Split iterations into chunks for a process pool. A small probe chunk is first run on each worker to measure
+    the time per iteration, the remaining iterations are then split into chunks that take about `target_seconds`,
+    with at least `oversubscription` chunks per worker so that faster workers pick up more chunks. """
+
+    def __init__(self, workers, oversubscription=4, target_seconds=1.0, probe_iterations=1000):
+        """
+        :param workers: The number of workers in the pool.
+        :param oversubscription: The minimum number of chunks per worker.
+        :param target_seconds: The desired time each chunk takes.
+        :param probe_iterations: The maximum iterations of the probe chunks.
+        """
+        self.workers = workers
+        self.oversubscription = oversubscription
+        self.target_seconds = target_seconds
+        self.probe_iterations = probe_iterations
+        # the total iterations and seconds each worker has run
+        self.iterations, self.seconds = collections.Counter(), collections.Counter()
+
+    @staticmethod
+    def _chunks(iterations, size, granularity):
+        # round the chunk size up to a multiple of granularity
+        size = max(granularity, int(math.ceil(size / granularity)) * granularity)
+        return [size] * (iterations // size) + ([iterations % size] if iterations % size else [])
+
+    def probe_chunks(self, iterations, granularity=1):
+        """ The chunks to measure the time per iteration, one for each worker. """
+        size = max(1, min(self.probe_iterations, iterations // (self.workers * self.oversubscription * 4)))
+        size = max(granularity, int(math.ceil(size / granularity)) * granularity)
+        return self._chunks(min(iterations, size * self.workers), size, granularity)
+
+    def chunks(self, iterations, seconds_per_iteration, granularity=1):
+        """ Split the iterations into chunks based on the measured time per iteration, the chunk sizes are multiples of
+        :granularity: except for the last one. """
+        if iterations <= 0:
+            return []
+        size = int(math.ceil(iterations / (self.workers * self.oversubscription)))
+        if seconds_per_iteration > 0:
+            size = min(size, int(self.target_seconds / seconds_per_iteration))
+        return self._chunks(iterations, max(1, size), granularity)
+
+    def record(self, pid, iterations, seconds):
+        self.iterations[pid] += iterations
+        self.seconds[pid] += seconds
+
+    def throughput(self):
+        """
+        :return: dict of iterations per second of each worker.
+        """
+        return {pid: self.iterations[pid] / self.seconds[pid] if self.seconds[pid] > 0 else float('inf')
+                for pid in self.iterations}
+
+    def run(self, process_pool, func, iterations, granularity=1, start=0):
+        """ Run func(start, chunk_iterations) for all chunks on the process pool and yield the results as they complete,
+        where start is the index of the first iteration of the chunk, counting from :start: in steps of
+        :granularity:. """
+        probe_chunks = self.probe_chunks(iterations, granularity)
+        probe_iterations, probe_seconds = 0, 0.0
+        for result, pid, chunk, seconds in imap_unordered(process_pool, functools.partial(_timed_chunk, func),
+                                                          self._starts(probe_chunks, start)):
+            self.record(pid, chunk, seconds)
+            probe_iterations, probe_seconds = probe_iterations + chunk, probe_seconds + seconds
+            yield result
+
+        chunks = self.chunks(iterations - probe_iterations,
+                             probe_seconds / probe_iterations if probe_iterations else 0.0, granularity)
+        for result, pid, chunk, seconds in imap_unordered(process_pool, functools.partial(_timed_chunk, func),
+                                                          self._starts(chunks, start + probe_iterations)):
+            self.record(pid, chunk, seconds)
+            yield result
+        logger.debug('ran {} chunks, throughput of each worker (iterations / second): {}'
+                     .format(len(probe_chunks) + len(chunks), self.throughput()))
+
+    @staticmethod
+    def _starts(chunks, start):
+        # pair each chunk with the index of its first iteration
+        starts = list(itertools.accumulate([start] + chunks[:-1]))
+        return list(zip(starts, chunks))
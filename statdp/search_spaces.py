@@ -0,0 +1,79 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+""" Strategies to generate the event search space of a numerical return value. A strategy is called with the sorted
+(combined) results of both inputs as a 1-D numpy array and returns a tuple of events, i.e., the open intervals
+(low, high) to count the results in. Options of the built-in strategies can be bound by functools.partial, e.g.,
+`functools.partial(quantiles, num=20)`. Categorical return values are not passed to the strategies, each of their
+values is an event. """
+import functools
+
+import numpy as np
+
+
+def densest(values, num=10, coverage=0.7):
+    """ The default strategy: one-sided events (-inf, alpha) with :num: thresholds evenly spaced over the narrowest
+    range that covers :coverage: of the results.
+    """
+    window = int(coverage * len(values))
+    # the width of the range covering `window` results, ending at each result
+    widths = values[window:] - values[:len(values) - window]
+    search_max = int(np.argmin(widths)) + window
+    search_min = search_max - window
+    thresholds = np.linspace(values[search_min], values[search_max], num=num)
+    return tuple((-float('inf'), float(alpha)) for alpha in thresholds)
+
+
+def quantiles(values, num=10, low=0.05, high=0.95):
+    """ One-sided events (-inf, alpha) with :num: thresholds at the evenly spaced quantiles from :low: to :high:,
+    which follow the distribution of the results rather than their range.
+    """
+    thresholds = np.unique(np.quantile(values, np.linspace(low, high, num=num)))
+    return tuple((-float('inf'), float(alpha)) for alpha in thresholds)
+
+
+def intervals(values, num=6, low=0.05, high=0.95):
+    """ Two-sided events (alpha, beta) for every pair of the :num: endpoints at the evenly spaced quantiles from :low:
+    to :high:, i.e., num * (num - 1) / 2 events.
+    """
+    endpoints = np.unique(np.quantile(values, np.linspace(low, high, num=num)))
+    lows, highs = np.triu_indices(len(endpoints), k=1)
+    return tuple(zip(endpoints[lows].tolist(), endpoints[highs].tolist()))
+
+
+def log_tails(values, num=5, smallest=1e-3):
+    """ One-sided events in both tails, (-inf, alpha) and (beta, inf), with :num: thresholds on each side at the
+    quantiles whose tail probabilities are log-spaced from :smallest: to 0.5, so that rare outputs are searched finer.
+    """
+    probabilities = np.geomspace(max(smallest, 1.0 / len(values)), 0.5, num=num)
+    lower = np.unique(np.quantile(values, probabilities))
+    upper = np.unique(np.quantile(values, 1 - probabilities))
+    return (tuple((-float('inf'), float(alpha)) for alpha in lower) +
+            tuple((float(beta), float('inf')) for beta in upper))
+
+
+def strategy_name(strategy):
+    """ The name of the strategy that identifies it across runs, including the options bound by functools.partial. """
+    if isinstance(strategy, functools.partial):
+        arguments = [repr(argument) for argument in strategy.args]
+        arguments.extend('{}={!r}'.format(key, value) for key, value in sorted(strategy.keywords.items()))
+        return '{}({})'.format(strategy_name(strategy.func), ', '.join(arguments))
+    return '{}.{}'.format(strategy.__module__, getattr(strategy, '__qualname__', type(strategy).__qualname__))
@@ -19,63 +19,291 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import collections
+import contextlib
 import functools
+import inspect
+import itertools
 import logging
+import os
+import tempfile
 
 import numpy as np
-import tqdm
-
 from statdp.hypotest import test_statistics
-from statdp.core import run_algorithm
+from statdp.cache import caching
+from statdp.profiler import profiling
+from statdp.core import CHUNK_SIZE, EventCounts, _database_key, _sample_chunks, _search_results, _spill_chunks, \
+    _spilled_results, epsilon_key, seed_sequence, spawn_seed
+from statdp.executors import collect_array, imap_unordered, share_array, shares_memory
+from statdp.scheduler import pool_size
 
 logger = logging.getLogger(__name__)
 
 
-def _evaluate_input(input_triplet, algorithm, iterations):
-    d1, d2, kwargs = input_triplet
-    return run_algorithm(algorithm, d1, d2, kwargs, None, iterations)
+def _groups(keys, processes):
+    """ Group the inputs by their d1 so that each group (run as one task) samples its d1 once. While there are fewer
+    groups than :processes:, the largest group is split in halves so that all processes are kept busy, and with a single
+    process all inputs form one group. Each half samples the shared d1 again, so the calls saved by sharing the d1
+    shrink as the pool grows: k inputs of one d1 split over k processes take as many calls as sampling each input.
+    :param keys: The (d1 key, d2 key) of each input.
+    :return: list of the indices of the inputs in each group.
+    """
+    if processes <= 1:
+        return [list(range(len(keys)))] if keys else []
+    groups = collections.OrderedDict()
+    for index, (key_d1, _) in enumerate(keys):
+        groups.setdefault(key_d1, []).append(index)
+    groups = list(groups.values())
+    while 0 < len(groups) < processes:
+        largest = max(range(len(groups)), key=lambda position: len(groups[position]))
+        if len(groups[largest]) < 2:
+            break
+        group = groups.pop(largest)
+        groups[largest:largest] = [group[:len(group) // 2], group[len(group) // 2:]]
+    return groups
 
 
-def select_event(algorithm, input_list, epsilon, iterations=100000, process_pool=None, quiet=False):
-    """
-    :param algorithm: The algorithm to run on
-    :param input_list: list of (d1, d2, kwargs) input pair for the algorithm to run
-    :param epsilon: Test epsilon value
-    :param iterations: The iterations to run algorithms
-    :param process_pool: The process pool to use, run with single process if None
-    :param quiet: Do not print progress bar or messages, logs are not affected, default is False.
-    :return: (d1, d2, kwargs, event) pair which has minimum p value from search space.
+def _evaluate_group(group, algorithm, iterations, seed, shared, search_space, spill_dir=None):
+    """ Run the algorithm on each distinct database of a group of inputs once and count the events of each input, the
+    samples of a database are dropped after its last input. Only the search spaces and the counts are sent back, the
+    counts through shared memory if the worker shares memory (see statdp.executors.shares_memory).
+    :param group: list of (index, (d1 key, d2 key), (d1, d2, kwargs)) of the inputs.
+    :param spill_dir: The directory to spill the samples to, see statdp.core.run_algorithm.
+    :return: (indices, search spaces, the counts of all inputs stacked in one array, None), or (None, None, None, error)
+    if the group fails. The error is sent back rather than raised, so that the counts of the other groups are still
+    collected and their shared memory blocks freed.
     """
+    try:
+        return _count_group(group, algorithm, iterations, seed, shared, search_space, spill_dir) + (None, )
+    except Exception as error:
+        return None, None, None, error
+
+
+def _count_group(group, algorithm, iterations, seed, shared, search_space, spill_dir):
+    # see _evaluate_group
+    last_use = {key: position for position, (_, keys, _) in enumerate(group) for key in keys}
+    samples, spaces, counts = {}, [], []
+    with contextlib.ExitStack() as stack:
+        # the spilled samples are removed once the group is counted
+        directory = stack.enter_context(tempfile.TemporaryDirectory(prefix='statdp-', dir=spill_dir)) \
+            if spill_dir is not None else None
+        for position, (_, keys, (d1, d2, kwargs)) in enumerate(group):
+            for key, database in zip(keys, (d1, d2)):
+                if key in samples:
+                    continue
+                if spill_dir is not None:
+                    samples[key] = _spill_chunks(algorithm, database, kwargs, iterations, CHUNK_SIZE,
+                                                 spawn_seed(seed, *key), os.path.join(directory, '{}-{}'.format(*key)))
+                else:
+                    samples[key] = _sample_chunks(algorithm, database, kwargs, iterations, CHUNK_SIZE,
+                                                  spawn_seed(seed, *key))
+            event_search_space, input_counts = (_spilled_results if spill_dir is not None else _search_results)(
+                samples[keys[0]], samples[keys[1]], iterations, search_space)
+            spaces.append(event_search_space)
+            counts.append(input_counts)
+            for key in keys:
+                if last_use[key] == position:
+                    result = samples.pop(key)
+                    for path in result if spill_dir is not None else ():
+                        os.remove(path)
+    counts = np.concatenate(counts) if counts else np.zeros((0, 2), dtype=np.int64)
+    return [index for index, _, _ in group], spaces, share_array(counts) if shared else counts
+
+
+def _evaluate_inputs(algorithm, input_list, iterations, process_pool, seed=None, search_space=None, spill_dir=None):
+    # run the algorithm on all inputs and collect the counts of all input/event pairs, see statdp.core.EventCounts
     if not callable(algorithm):
         raise ValueError('Algorithm must be callable')
 
-    # fill in other arguments for _evaluate_input function, leaving out `input` to be filled
-    partial_evaluate_input = functools.partial(_evaluate_input,
-                                               algorithm=algorithm, iterations=iterations)
+    input_list = list(input_list)
+    shared = process_pool is not None and shares_memory(process_pool)
+
+    # the inputs often share a database (e.g., d1 of the generated inputs), so the inputs are run in groups that run
+    # the algorithm once on each of their distinct databases, which are seeded by their content so that the samples do
+    # not depend on the other inputs or the grouping
+    keys = []
+    for d1, d2, kwargs in input_list:
+        key_d1, key_d2 = _database_key(d1, kwargs), _database_key(d2, kwargs)
+        # the two databases of an input are sampled independently even if they are the same
+        keys.append(((key_d1, 0), (key_d2, int(key_d1 == key_d2))))
+    groups = _groups(keys, 1 if process_pool is None else pool_size(process_pool))
+    logger.debug('running {} inputs in {} groups, sampling {} databases'.format(
+        len(input_list), len(groups), sum(len({key for index in group for key in keys[index]}) for group in groups)))
+
+    # fill in other arguments for _evaluate_group function, leaving out the group to be filled
+    partial_evaluate_group = functools.partial(_evaluate_group, algorithm=algorithm, iterations=iterations, seed=seed,
+                                               shared=shared, search_space=search_space, spill_dir=spill_dir)
+    returned = []
+    try:
+        tasks = ([(index, keys[index], input_list[index]) for index in group] for group in groups)
+        for result in imap_unordered(process_pool, partial_evaluate_group, tasks):
+            returned.append(result)
+    finally:
+        # collect the counts of all groups sent back, even if the pool fails, so that no shared memory block is left
+        returned = [(indices, spaces, collect_array(counts) if shared and counts is not None else counts, error)
+                    for indices, spaces, counts, error in returned]
+    errors = [error for _, _, _, error in returned if error is not None]
+    if errors:
+        raise errors[0]
+
+    results = {}
+    for indices, spaces, counts, _ in returned:
+        sizes = [int(np.prod([len(events) for events in event_search_space])) for event_search_space in spaces]
+        for index, event_search_space, input_counts in zip(indices, spaces,
+                                                           np.split(counts, np.cumsum(sizes)[:-1])):
+            results[index] = event_search_space, input_counts
 
-    results = process_pool.imap_unordered(partial_evaluate_input, input_list) if process_pool else \
-        map(partial_evaluate_input, input_list)
+    # put the results back in the order of the input list, so that the selection does not depend on the scheduling
+    return EventCounts(input_list, [results[index][0] for index in range(len(input_list))],
+                       [results[index][1] for index in range(len(input_list))])
 
-    counts, input_event_pairs = [], []
-    # flatten the results for all input/event pairs
-    for local_counts, local_input_event_pair in results:
-        counts.extend(local_counts)
-        input_event_pairs.extend(local_input_event_pair)
 
-    # calculate p-values based on counts
+def _p_values(event_counts, epsilon, iterations, quiet, seed=None):
+    # calculate p-values based on counts, events with too few iterations in them are not tested and get inf
     threshold = 0.001 * iterations * np.exp(epsilon)
-    p_values_generator = (test_statistics(cx, cy, epsilon, iterations, process_pool=process_pool)
-                          if cx + cy > threshold else float('inf') for (cx, cy) in counts)
+    p_values_generator = (test_statistics(cx, cy, epsilon, iterations, seed=spawn_seed(seed, index))
+                          if cx + cy > threshold else float('inf')
+                          for index, (cx, cy) in enumerate(event_counts.counts.tolist()))
 
-    # wrap the tqdm around the generator for progress information
-    with tqdm.tqdm(p_values_generator, desc='Evaluating events', total=len(counts), unit='event', disable=quiet) \
-            as wrapper:
-        input_p_values = np.fromiter(wrapper, dtype=np.float64, count=len(counts))
+    # wrap the tqdm around the generator for progress information, tqdm is imported on use to keep `import statdp` fast
+    import tqdm
+    with tqdm.tqdm(p_values_generator, desc='Evaluating events', total=len(event_counts), unit='event',
+                   disable=quiet) as wrapper:
+        return np.fromiter(wrapper, dtype=np.float64, count=len(event_counts))
 
-    # log the information for debug purposes
-    for ((d1, d2, kwargs, event), (cx, cy), p) in zip(input_event_pairs, counts, input_p_values):
-        logger.debug('d1: {} | d2: {} | kwargs: {} | event: {} | p-value: {:5.3f} | cx: {} | cy: {} | ratio: {:5.3f}'
-                     .format(d1, d2, kwargs, event, p, cx, cy, float(cy) / cx if cx != 0 else float('inf')))
+
+def _select(event_counts, epsilon, iterations, quiet, seed=None):
+    # :return: (minimum p-value, the (d1, d2, kwargs, event) pair of it)
+    input_p_values = _p_values(event_counts, epsilon, iterations, quiet, seed)
+
+    # log the information for debug purposes, the tuples are only built if debug logging is enabled
+    if logger.isEnabledFor(logging.DEBUG):
+        for row, ((cx, cy), p) in enumerate(zip(event_counts.counts.tolist(), input_p_values)):
+            d1, d2, kwargs, event = event_counts.pair(row)
+            logger.debug('d1: {} | d2: {} | kwargs: {} | event: {} | p-value: {:5.3f} | cx: {} | cy: {} | '
+                         'ratio: {:5.3f}'.format(d1, d2, kwargs, event, p, cx, cy,
+                                                 float(cy) / cx if cx != 0 else float('inf')))
 
     # find an (d1, d2, kwargs, event) pair which has minimum p value from search space
-    return input_event_pairs[input_p_values.argmin()]
+    row = int(input_p_values.argmin())
+    return float(input_p_values[row]), event_counts.pair(row)
+
+
+# the iterations of the first round of successive halving relative to the full iterations, doubled in each round
+_SCREEN_FRACTION = 1 / 16
+# successive halving stops once at most this many inputs are left, which are then run with the full iterations
+_FINALISTS = 2
+
+
+def _successive_halving(algorithm, input_list, epsilon, iterations, process_pool, seed, search_space, spill_dir=None):
+    """ Screen the inputs by successive halving: run all inputs with a fraction of the iterations, keep the half with
+    the lowest p-values (of their best events) and double the iterations for the next round, until at most _FINALISTS
+    inputs are left or the iterations reach the full iterations.
+    :return: The indices of the remaining inputs in :input_list:, in ascending order.
+    """
+    indices = list(range(len(input_list)))
+    budget, round_index = max(int(iterations * _SCREEN_FRACTION), 1), 0
+    while len(indices) > _FINALISTS and budget < iterations:
+        event_counts = _evaluate_inputs(algorithm, [input_list[index] for index in indices], budget, process_pool,
+                                        spawn_seed(seed, round_index, 0), search_space, spill_dir)
+        p_values = np.full(len(indices), np.inf)
+        np.minimum.at(p_values, event_counts.input_ids,
+                      _p_values(event_counts, epsilon, budget, True, spawn_seed(seed, round_index, 1)))
+        survivors = np.argsort(p_values, kind='stable')[:(len(indices) + 1) // 2]
+        logger.debug('successive halving round {}: {} of {} inputs are kept after {} iterations'
+                     .format(round_index, len(survivors), len(indices), budget))
+        indices = sorted(indices[int(survivor)] for survivor in survivors)
+        budget, round_index = budget * 2, round_index + 1
+    return indices
+
+
+def _batches(input_list, batch_size, feedback):
+    """ Split the inputs into lists of at most :batch_size: inputs, or a single list if :batch_size: is None. Before
+    each later batch, a generator of inputs (e.g., statdp.generators.stream_databases) is sent the result of
+    feedback(), so that it can propose neighbors of the best input so far.
+    :return: generator of (the index of the first input of the batch, list of the inputs in the batch).
+    """
+    if batch_size is None:
+        yield 0, list(input_list)
+        return
+    if batch_size < 1:
+        raise ValueError('batch_size must be positive')
+    iterator, offset = iter(input_list), 0
+    batch = list(itertools.islice(iterator, batch_size))
+    while batch:
+        yield offset, batch
+        offset += len(batch)
+        try:
+            first = iterator.send(feedback()) if inspect.isgenerator(iterator) else next(iterator)
+        except StopIteration:
+            return
+        batch = [first] + list(itertools.islice(iterator, batch_size - 1))
+
+
+def select_event(algorithm, input_list, epsilon, iterations=100000, process_pool=None, quiet=False, seed=None,
+                 profiler=None, search_space=None, adaptive=False, batch_size=None, cache=None, spill_dir=None):
+    """
+    :param algorithm: The algorithm to run on
+    :param input_list: list (or any iterable, e.g., statdp.generators.stream_databases) of (d1, d2, kwargs) input pair
+    for the algorithm to run
+    :param epsilon: Test epsilon value
+    :param iterations: The iterations to run algorithms
+    :param process_pool: The process pool (or statdp.Session / executor) to use, run with single process if None
+    :param quiet: Do not print progress bar or messages, logs are not affected, default is False.
+    :param seed: The seed (int or numpy.random.SeedSequence) for reproducible selection, fresh entropy if None.
+    :param profiler: The statdp.Profiler to record the time of each phase to, not profiled if None.
+    :param search_space: The strategy to generate the event search space of numerical return values, see
+    statdp.search_spaces, statdp.search_spaces.densest is used if None.
+    :param adaptive: Screen the inputs by successive halving with a fraction of the iterations first and only run the
+    remaining few with the full :iterations:. The selected pair is the same as without screening as long as its input
+    is not screened out, which takes far fewer algorithm calls when there are many inputs.
+    :param batch_size: Consume the inputs in batches of at most this many inputs and only keep the best pair so far,
+    so that the memory does not grow with the number of inputs. The selected pair is the same as without batches unless
+    :adaptive: is True, which screens each batch separately. All inputs are taken in one batch if None.
+    :param cache: The statdp.SampleCache to draw the samples from and add them to, only used if :seed: is given.
+    :param spill_dir: The directory to write the samples to rather than keeping them in memory, see
+    statdp.core.run_algorithm. It must be reachable by the workers of :process_pool:. Kept in memory if None.
+    :return: (d1, d2, kwargs, event) pair which has minimum p value from search space.
+    """
+    with profiling(profiler), caching(cache, seed):
+        seed = seed_sequence(seed)
+        best_p, best_pair = float('inf'), None
+        for offset, batch in _batches(input_list, batch_size, lambda: best_pair[:3]):
+            # the databases are seeded by their content, so the remaining inputs are run as if they were not screened
+            indices = list(range(len(batch))) if not adaptive else \
+                _successive_halving(algorithm, batch, epsilon, iterations, process_pool, spawn_seed(seed, 2),
+                                    search_space, spill_dir)
+            event_counts = _evaluate_inputs(algorithm, [batch[index] for index in indices], iterations, process_pool,
+                                            spawn_seed(seed, 0), search_space, spill_dir)
+            p, pair = _select(event_counts, epsilon, iterations, quiet, spawn_seed(seed, 1, offset))
+            if best_pair is None or p < best_p:
+                best_p, best_pair = p, pair
+        if best_pair is None:
+            raise ValueError('input_list must not be empty')
+        return best_pair
+
+
+def select_events(algorithm, input_list, epsilons, iterations=100000, process_pool=None, quiet=False, seed=None,
+                  profiler=None, search_space=None, cache=None, spill_dir=None):
+    """ Select events for a sweep of test epsilons, the algorithm is run only once and the counts are shared by all
+    epsilons since the test epsilon only affects the p-values computed from the counts.
+    :param algorithm: The algorithm to run on
+    :param input_list: list of (d1, d2, kwargs) input pair for the algorithm to run
+    :param epsilons: The list of test epsilon values
+    :param iterations: The iterations to run algorithms
+    :param process_pool: The process pool (or statdp.Session / executor) to use, run with single process if None
+    :param quiet: Do not print progress bar or messages, logs are not affected, default is False.
+    :param seed: The seed (int or numpy.random.SeedSequence) for reproducible selection, fresh entropy if None.
+    :param profiler: The statdp.Profiler to record the time of each phase to, not profiled if None.
+    :param search_space: The strategy to generate the event search space of numerical return values, see
+    statdp.search_spaces, statdp.search_spaces.densest is used if None.
+    :param cache: The statdp.SampleCache to draw the samples from and add them to, only used if :seed: is given.
+    :param spill_dir: The directory to write the samples to rather than keeping them in memory, see select_event.
+    :return: [(d1, d2, kwargs, event), ...] pair which has minimum p value from search space for each epsilon.
+    """
+    with profiling(profiler), caching(cache, seed):
+        seed = seed_sequence(seed)
+        event_counts = _evaluate_inputs(algorithm, input_list, iterations, process_pool, spawn_seed(seed, 0),
+                                        search_space, spill_dir)
+        return [_select(event_counts, epsilon, iterations, quiet, spawn_seed(seed, 1, epsilon_key(epsilon)))[1]
+                for epsilon in epsilons]
@@ -0,0 +1,102 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import collections
+import functools
+import logging
+import os
+import threading
+import time
+
+from statdp.executors import Executor
+from statdp.scheduler import ChunkScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_up():
+    # import the heavy modules once when the worker starts rather than on the first task
+    import statdp.core
+    import statdp.hypotest
+
+
+def _timed(func, argument):
+    # run the task and report the time it takes along with the worker it runs on
+    start = time.perf_counter()
+    result = func(argument)
+    return result, os.getpid(), time.perf_counter() - start
+
+
+class Session(Executor):
+    """ A warm process pool that can be shared across detections, it can be passed as `process_pool` to
+    select_event / hypothesis_test or as `session` to detect_counterexample, and keeps statistics of the tasks. """
+
+    local = True
+
+    def __init__(self, processes=0):
+        """
+        :param processes: The number of worker processes, 0 means auto-detection.
+        """
+        import multiprocessing as mp
+        self.processes = os.cpu_count() if processes == 0 else processes
+        self._pool = mp.Pool(self.processes, initializer=_warm_up)
+        self._start = time.perf_counter()
+        # the tasks are dispatched by the task handler thread of the pool, guard the statistics against the readers
+        self._lock = threading.Lock()
+        self.dispatched, self.completed = 0, 0
+        self.busy = collections.Counter()
+        self.scheduler = ChunkScheduler(self.processes)
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        """ Same as multiprocessing.Pool.imap_unordered, with the tasks recorded in the statistics. """
+        def dispatch():
+            for argument in iterable:
+                with self._lock:
+                    self.dispatched += 1
+                yield argument
+
+        for result, pid, elapsed in self._pool.imap_unordered(functools.partial(_timed, func), dispatch(), chunksize):
+            with self._lock:
+                self.completed += 1
+                self.busy[pid] += elapsed
+            yield result
+
+    def stats(self):
+        """
+        :return: dict of the tasks dispatched / completed, the busy time of each worker and the utilization of the
+        workers, i.e., the fraction of time the workers are busy since the session starts, as well as the throughput
+        (iterations per second) of each worker in hypothesis tests.
+        """
+        with self._lock:
+            wall = time.perf_counter() - self._start
+            dispatched, completed, busy = self.dispatched, self.completed, dict(self.busy)
+        return {'processes': self.processes, 'dispatched': dispatched, 'completed': completed, 'busy': busy,
+                'wall': wall, 'throughput': self.scheduler.throughput(),
+                'utilization': sum(busy.values()) / (self.processes * wall) if wall > 0 else 0.0}
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        logger.debug('session closed with stats {}'.format(self.stats()))
+
+    def terminate(self):
+        self._pool.terminate()
+        self._pool.join()
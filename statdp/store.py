@@ -0,0 +1,102 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def result_key(algorithm, epsilon, **settings):
+    """ The key of a detection result, which identifies the algorithm by its qualified name and includes the test
+    epsilon and the settings (e.g., kwargs, iterations) the result depends on.
+    :return: The canonical JSON string of the key.
+    """
+    key = dict(settings, algorithm='{}.{}'.format(algorithm.__module__, algorithm.__qualname__), epsilon=epsilon)
+    return json.dumps(key, sort_keys=True, default=repr)
+
+
+class ResultStore:
+    """ Append-only store of detection results in a JSON lines file, one result per line. The results are written as
+    soon as they are added, so that an interrupted detection can be resumed by skipping the stored results. """
+
+    def __init__(self, path):
+        """
+        :param path: The path of the JSON lines file, created on the first write if it does not exist.
+        """
+        self.path = path
+        self._results = {}
+        # whether the file ends in the middle of a line, which the next write has to terminate first
+        self._partial = False
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line_number, line in enumerate(f, start=1):
+                    self._partial = not line.endswith('\n')
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # the last line may be partially written if the process was killed
+                        logger.warning('Skipping malformed line {} in {}'.format(line_number, path))
+                        continue
+                    self._results[record['key']] = record['result']
+            logger.info('Loaded {} results from {}'.format(len(self._results), path))
+
+    def __contains__(self, key):
+        return key in self._results
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key):
+        """
+        :return: The stored (epsilon, p, d1, d2, kwargs, event, ...) for :key:, None if not stored.
+        """
+        if key not in self._results:
+            return None
+        epsilon, p, d1, d2, kwargs, event = self._results[key][:6]
+        return (epsilon, p, d1, d2, kwargs, tuple(event)) + tuple(self._results[key][6:])
+
+    def put(self, key, result):
+        """ Append (epsilon, p, d1, d2, kwargs, event) :result: for :key: to the file, followed by any extra values of
+        the result (e.g., the iterations of a sequential test). """
+        epsilon, p, d1, d2, kwargs, event = result[:6]
+        # the databases and events may be numpy arrays / tuples of numpy scalars, store them as plain lists
+        extras = [_plain(extra) for extra in result[6:]]
+        result = [epsilon, float(p), _plain(d1), _plain(d2), kwargs, _plain(event)] + extras
+        line = json.dumps({'key': key, 'result': result}, default=repr)
+        with open(self.path, 'a') as f:
+            f.write(('\n' if self._partial else '') + line + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._partial = False
+        self._results[key] = result
+
+
+def _plain(value):
+    # convert numpy arrays and scalars (or sequences of them) into plain python values for JSON
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
@@ -0,0 +1,45 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+""" Run workers for a statdp.WorkQueueExecutor, e.g., `STATDP_AUTHKEY=... python -m statdp.worker HOST:PORT -p 8` on
+each host. The key is read from the STATDP_AUTHKEY environment variable rather than the command line, which the other
+users of the host can see. """
+import argparse
+import os
+
+from statdp.executors import start_workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run workers for a statdp WorkQueueExecutor.')
+    parser.add_argument('address', help='HOST:PORT of the executor')
+    parser.add_argument('-p', '--processes', type=int, default=0, help='The number of workers, 0 for all cores')
+    arguments = parser.parse_args()
+    authkey = os.environ.get('STATDP_AUTHKEY')
+    if not authkey:
+        parser.error('the key of the executor must be given in the STATDP_AUTHKEY environment variable')
+    host, port = arguments.address.rsplit(':', 1)
+    for process in start_workers((host, int(port)), authkey.encode(), arguments.processes):
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -48,3 +48,51 @@ def test_histogram():
     assert isinstance(histogram([1, 2], 1), float)
     assert histogram_eps([1, 2], 0) == 1
     assert isinstance(histogram_eps([1, 2], 1), float)
+
+
+def test_batched():
+    queries = [1, 2, 3, 2, 1]
+    for scalar, vectorized in ((noisy_max_v1a, noisy_max_v1a_batched), (noisy_max_v1b, noisy_max_v1b_batched),
+                               (noisy_max_v2a, noisy_max_v2a_batched), (noisy_max_v2b, noisy_max_v2b_batched),
+                               (histogram, histogram_batched), (histogram_eps, histogram_eps_batched)):
+        np.random.seed(0)
+        expected = np.asarray([scalar(queries, 0.5) for _ in range(100)])
+        np.random.seed(0)
+        assert np.array_equal(vectorized(queries, 0.5, size=100), expected)
+        # the same holds when drawing from a numpy.random.Generator
+        rng = np.random.default_rng(0)
+        expected = np.asarray([scalar(queries, 0.5, rng=rng) for _ in range(100)])
+        assert np.array_equal(vectorized(queries, 0.5, size=100, rng=np.random.default_rng(0)), expected)
+
+
+def test_sparsevector_batched():
+    assert SVT_batched([1, 2, 3, 4], float('inf'), 1, 2.5, size=2).tolist() == [2, 2]
+    assert iSVT1_batched([1, 2, 3, 4], float('inf'), 1, 1.5, size=2).tolist() == [3, 3]
+    assert iSVT1_batched([1, 2, 3, 4], float('inf'), 1, 2.5, size=2).tolist() == [4, 4]
+    assert iSVT1_batched([4, 3, 2, 1], float('inf'), 1, 2.5, size=2).tolist() == [0, 0]
+    assert iSVT2_batched([1, 2, 3, 4], float('inf'), 1, 3.5, size=2).tolist() == [3, 3]
+    assert iSVT3_batched([1, 2, 3, 4], float('inf'), 1, 1.5, size=2).tolist() == [3, 3]
+    assert iSVT3_batched([1, 2, 3, 4], float('inf'), 1, 3.5, size=2).tolist() == [3, 3]
+    assert iSVT4_batched([1, 2, 3, 4], float('inf'), 1, 2, size=2).tolist() == [[2, 3.0], [2, 3.0]]
+    assert iSVT4_batched([1, 2, 3, 4], float('inf'), 2, 5, size=1).tolist() == [[4, 0.0]]
+    # the same generator seed gives the same outputs
+    assert np.array_equal(SVT_batched([1, 2, 3, 4], 0.5, 1, 2.5, size=100, rng=np.random.default_rng(1)),
+                          SVT_batched([1, 2, 3, 4], 0.5, 1, 2.5, size=100, rng=np.random.default_rng(1)))
+
+
+def test_sparsevector_batched_distribution():
+    # the batched kernels should have the same output distribution as the scalar versions
+    queries, iterations = [1, 1, 0, 2, 1, 0, 1, 2, 0, 1], 20000
+    for scalar, vectorized in ((SVT, SVT_batched), (iSVT1, iSVT1_batched), (iSVT2, iSVT2_batched),
+                               (iSVT3, iSVT3_batched), (iSVT4, iSVT4_batched)):
+        np.random.seed(0)
+        expected = np.asarray([scalar(queries, 0.7, 2, 1) for _ in range(iterations)], dtype=np.float64)
+        result = vectorized(queries, 0.7, 2, 1, size=iterations)
+        # compare the distribution of each output via Kolmogorov-Smirnov distance
+        for column in range(result.reshape(iterations, -1).shape[1]):
+            sample_1 = np.sort(expected.reshape(iterations, -1)[:, column])
+            sample_2 = np.sort(result.reshape(iterations, -1)[:, column])
+            values = np.union1d(sample_1, sample_2)
+            distance = np.abs(np.searchsorted(sample_1, values, side='right') -
+                              np.searchsorted(sample_2, values, side='right')).max() / iterations
+            assert distance < 0.03, '{}: {}'.format(vectorized.__name__, distance)
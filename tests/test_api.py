@@ -19,12 +19,15 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import inspect
 import logging
+import os
 
 from flaky import flaky
 
 from statdp.algorithms import (SVT, iSVT1, iSVT2, iSVT3, iSVT4, noisy_max_v1a,
-                               noisy_max_v1b, noisy_max_v2a, noisy_max_v2b)
+                               noisy_max_v1b, noisy_max_v2a, noisy_max_v2b, noisy_max_v1a_batched,
+                               SVT_batched, iSVT4_batched)
 from statdp import detect_counterexample
 
 
@@ -98,3 +101,46 @@ def test_iSVT3():
 @flaky(max_runs=5)
 def test_iSVT4():
     assert_incorrect_algorithm(iSVT4, {'N': 1, 'T': 1}, num_input=10)
+
+
+@flaky(max_runs=5)
+def test_noisy_max_v1a_batched():
+    assert_correct_algorithm(noisy_max_v1a_batched)
+
+
+@flaky(max_runs=5)
+def test_SVT_batched():
+    assert_correct_algorithm(SVT_batched, {'N': 1, 'T': 0.5}, num_input=10)
+
+
+@flaky(max_runs=5)
+def test_iSVT4_batched():
+    assert_incorrect_algorithm(iSVT4_batched, {'N': 1, 'T': 1}, num_input=10)
+
+
+@flaky(max_runs=5)
+def test_sequential():
+    result = detect_counterexample(noisy_max_v1a_batched, (0.6, 0.7, 0.8), {'epsilon': 0.7}, sequential=True)
+    assert result[0][1] <= 0.05 and result[1][1] >= 0.05 and result[2][1] >= 0.95
+    # the iterations each sequential test ran for are returned
+    assert all(len(local_result) == 7 and 0 < local_result[6] <= 500000 for local_result in result)
+
+
+@flaky(max_runs=5)
+def test_sweep():
+    result = detect_counterexample(noisy_max_v1a_batched, (0.6, 0.7, 0.8), {'epsilon': 0.7}, sweep=True)
+    assert len(result) == 3
+    assert result[0][1] <= 0.05 and result[1][1] >= 0.05 and result[2][1] >= 0.95
+    result = detect_counterexample(iSVT4_batched, (0.6, 0.7), {'epsilon': 0.7, 'N': 1, 'T': 1}, num_input=10,
+                                   sweep=True)
+    assert result[0][1] <= 0.05 and result[1][1] <= 0.05
+
+
+def test_readme_signature():
+    # the signature and notes of detect_counterexample in README.md are a copy of the source, which must not drift
+    source = inspect.getsource(detect_counterexample)
+    expected = source[:source.index('    """', source.index('"""') + 3) + len('    """')] + '\n'
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'README.md')) as f:
+        readme = f.read()
+    start = readme.index('```python\ndef detect_counterexample') + len('```python\n')
+    assert readme[start:readme.index('```', start)] == expected
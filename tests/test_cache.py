@@ -0,0 +1,111 @@
+# MIT License
+#
+# Copyright (c) 2018 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import os
+
+import numpy as np
+
+from statdp import Profiler, SampleCache
+from statdp.algorithms import noisy_max_v1a, noisy_max_v1a_batched
+from statdp.core import run_algorithm
+from statdp.hypotest import hypothesis_test
+from statdp.selectors import select_event
+
+
+def _noisy_max(Q, epsilon, rng=None):
+    return int(np.argmax(np.asarray(Q) + rng.laplace(scale=2.0 / epsilon, size=len(Q))))
+
+
+def _noisy_max_changed(Q, epsilon, rng=None):
+    return int(np.argmax(np.asarray(Q) + rng.laplace(scale=1.0 / epsilon, size=len(Q))))
+
+
+def _scaled_noisy_max(scale):
+    def noisy_max(Q, epsilon, rng=None, *, noise=scale):
+        return int(np.argmax(np.asarray(Q) + rng.laplace(scale=noise * scale / epsilon, size=len(Q))))
+    return noisy_max
+
+
+def _noisy_max_scale(Q, epsilon, scale=2.0, rng=None):
+    return int(np.argmax(np.asarray(Q) + rng.laplace(scale=scale / epsilon, size=len(Q))))
+
+
+def test_cache(tmp_path):
+    cache = SampleCache(str(tmp_path))
+    d1, d2, kwargs = [0] + [2] * 4, [1] * 5, {'epsilon': 0.5}
+    first, second = Profiler(), Profiler()
+    expected = run_algorithm(noisy_max_v1a_batched, d1, d2, kwargs, None, 20000, seed=0, profiler=first, cache=cache)
+    assert run_algorithm(noisy_max_v1a_batched, d1, d2, kwargs, None, 20000, seed=0, profiler=second,
+                         cache=cache) == expected
+    assert first.calls == 40000 and second.calls == 0
+    # the keys depend on the code, the arguments, the database and the seed
+    key = cache.key(_noisy_max, d1, kwargs, 100, np.random.SeedSequence(0))
+    assert key == cache.key(_noisy_max, np.asarray(d1), dict(kwargs), 100, np.random.SeedSequence(0))
+    assert key != cache.key(_noisy_max_changed, d1, kwargs, 100, np.random.SeedSequence(0))
+    assert key != cache.key(_noisy_max, d2, kwargs, 100, np.random.SeedSequence(0))
+    assert key != cache.key(_noisy_max, d1, {'epsilon': 1}, 100, np.random.SeedSequence(0))
+    assert key != cache.key(_noisy_max, d1, kwargs, 100, np.random.SeedSequence(1))
+    # as well as the default arguments and the closure cells of the algorithm
+    defaults = _noisy_max_scale.__defaults__
+    key = cache.key(_noisy_max_scale, d1, kwargs, 100, np.random.SeedSequence(0))
+    try:
+        _noisy_max_scale.__defaults__ = (1.0, None)
+        assert key != cache.key(_noisy_max_scale, d1, kwargs, 100, np.random.SeedSequence(0))
+    finally:
+        _noisy_max_scale.__defaults__ = defaults
+    assert key == cache.key(_noisy_max_scale, d1, kwargs, 100, np.random.SeedSequence(0))
+    key = cache.key(_scaled_noisy_max(2.0), d1, kwargs, 100, np.random.SeedSequence(0))
+    assert key == cache.key(_scaled_noisy_max(2.0), d1, kwargs, 100, np.random.SeedSequence(0))
+    assert key != cache.key(_scaled_noisy_max(1.0), d1, kwargs, 100, np.random.SeedSequence(0))
+    algorithm = _scaled_noisy_max(2.0)
+    algorithm.__kwdefaults__ = {'noise': 3.0}
+    assert key != cache.key(algorithm, d1, kwargs, 100, np.random.SeedSequence(0))
+
+
+def test_cache_top_up(tmp_path):
+    cache = SampleCache(str(tmp_path))
+    d1, d2, kwargs = [0] + [2] * 4, [1] * 5, {'epsilon': 0.5}
+    hypothesis_test(noisy_max_v1a_batched, d1, d2, kwargs, (0, ), 0.5, 20000, seed=0, cache=cache)
+    # the first chunks are drawn from the cache and only the missing ones are run
+    profiler = Profiler()
+    p_values = hypothesis_test(noisy_max_v1a_batched, d1, d2, kwargs, (0, ), 0.5, 50000, seed=0, profiler=profiler,
+                               cache=cache)
+    assert profiler.calls == 2 * 30000
+    assert hypothesis_test(noisy_max_v1a_batched, d1, d2, kwargs, (0, ), 0.5, 50000, seed=0) == p_values
+    # the samples of unseeded runs are not cached
+    files = len(os.listdir(str(tmp_path)))
+    select_event(noisy_max_v1a, [(d1, d2, kwargs)], 0.5, 10000, quiet=True, cache=cache)
+    assert len(os.listdir(str(tmp_path))) == files
+
+
+def test_cache_eviction(tmp_path):
+    cache = SampleCache(str(tmp_path))
+    cache.put('size', (np.arange(10, dtype=np.float64), ))
+    cache = SampleCache(str(tmp_path), max_bytes=3 * os.path.getsize(os.path.join(str(tmp_path), 'size.npy')))
+    cache.clear()
+    for index in range(5):
+        cache.put(str(index), (np.arange(10, dtype=np.float64), ))
+        os.utime(os.path.join(str(tmp_path), '{}.npy'.format(index)), (index, index))
+    # the least recently used entries are removed to keep the size within the cap
+    assert sorted(os.listdir(str(tmp_path))) == ['2.npy', '3.npy', '4.npy']
+    assert np.array_equal(cache.get('2')[0], np.arange(10))
+    cache.put('5', (np.arange(10, dtype=np.float64), ))
+    assert sorted(os.listdir(str(tmp_path))) == ['2.npy', '4.npy', '5.npy']
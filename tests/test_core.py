@@ -0,0 +1,123 @@
+# MIT License
+#
+# Copyright (c) 2018 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import itertools
+import os
+
+import numpy as np
+
+from statdp import core
+from statdp.core import EventCounts, _count_events, _sample_chunks, _search_results, _spill_chunks, _spilled_results, \
+    run_algorithm, seed_sequence, spawn_seed
+from statdp.algorithms import histogram_batched, iSVT4_batched, noisy_max_v1a, noisy_max_v1a_batched
+from statdp.search_spaces import quantiles
+
+
+def _count_events_with_masks(result_d1, result_d2, event_search_space):
+    counts = []
+    for event in itertools.product(*event_search_space):
+        event_counts = []
+        for result in (result_d1, result_d2):
+            check = np.full(len(result[0]), True)
+            for row, separate_event in enumerate(event):
+                if np.issubdtype(type(separate_event), np.number):
+                    check &= result[row] == separate_event
+                else:
+                    check &= (result[row] > separate_event[0]) & (result[row] < separate_event[1])
+            event_counts.append(np.count_nonzero(check))
+        counts.append(event_counts)
+    return np.asarray(counts)
+
+
+def test_count_events():
+    result_d1 = (np.random.randint(0, 5, 1000), np.round(np.random.normal(size=1000), 1))
+    result_d2 = (np.random.randint(0, 5, 1000), np.round(np.random.normal(size=1000), 1))
+    result_d1[1][:3] = (float('nan'), -float('inf'), float('inf'))
+    event_search_space = ((0, 1, 4, 7),
+                          ((-float('inf'), 0.1), (-0.5, 0.5), (0.0, float('inf')), (-float('inf'), float('inf'))))
+    assert np.array_equal(_count_events(result_d1, result_d2, event_search_space),
+                          _count_events_with_masks(result_d1, result_d2, event_search_space))
+
+
+def test_run_algorithm():
+    counts, input_event_pairs = run_algorithm(iSVT4_batched, [1] * 10, [0] * 10, {'epsilon': 0.7, 'N': 1, 'T': 1},
+                                              None, 10000)
+    assert len(counts) == len(input_event_pairs) > 1
+    assert all(cx >= cy for cx, cy in counts)
+    for (cx, cy), (_, _, _, event) in zip(counts, input_event_pairs):
+        assert len(event) == 2
+
+
+def test_run_algorithm_chunks():
+    d1, d2, kwargs = [0] + [2] * 4, [1] * 5, {'epsilon': 0.5}
+    for algorithm in (noisy_max_v1a, noisy_max_v1a_batched):
+        for chunk_size in (1000, 3000, 20000):
+            (cx, cy), *_ = run_algorithm(algorithm, d1, d2, kwargs, (0, ), 10000, chunk_size=chunk_size)[0]
+            # noisy_max_v1a returns 0 for d1 with probability ~0.2 and for d2 with probability ~0.12
+            assert 1700 < cx < 2300 and 1000 < cy < 1500
+
+
+def test_run_algorithm_spill(tmp_path):
+    d1, d2, kwargs = [1] * 5, [0] + [2] * 4, {'epsilon': 0.7}
+    # categorical, numerical and multiple return values
+    for algorithm, algorithm_kwargs in ((noisy_max_v1a, kwargs), (histogram_batched, kwargs),
+                                        (iSVT4_batched, {'epsilon': 0.7, 'N': 1, 'T': 1})):
+        expected = run_algorithm(algorithm, d1, d2, algorithm_kwargs, None, 25000, seed=0)
+        assert run_algorithm(algorithm, d1, d2, algorithm_kwargs, None, 25000, seed=0,
+                             spill_dir=str(tmp_path)) == expected
+    # the spilled samples are removed afterwards
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_spilled_results(tmp_path, monkeypatch):
+    seed, results, paths = seed_sequence(0), [], []
+    for index, database in enumerate(([1] * 5, [0] + [2] * 4)):
+        results.append(_sample_chunks(histogram_batched, database, {'epsilon': 0.7}, 25000, 10000,
+                                      spawn_seed(seed, index)))
+        paths.append(_spill_chunks(histogram_batched, database, {'epsilon': 0.7}, 25000, 10000, spawn_seed(seed, index),
+                                   os.path.join(str(tmp_path), str(index))))
+    event_search_space, counts = _search_results(*results, 25000)
+    spilled_search_space, spilled_counts = _spilled_results(*paths, 25000, block_size=3000)
+    assert spilled_search_space == event_search_space and np.array_equal(spilled_counts, counts)
+    # beyond _MAX_SUMMARY results the search space is generated from a summary, the counts are still exact
+    event_search_space, _ = _search_results(*results, 25000, quantiles)
+    monkeypatch.setattr(core, '_MAX_SUMMARY', 2000)
+    spilled_search_space, spilled_counts = _spilled_results(*paths, 25000, quantiles, block_size=3000)
+    assert np.allclose(spilled_search_space, event_search_space, atol=0.05)
+    assert np.array_equal(spilled_counts, _count_events(*results, spilled_search_space))
+
+
+def test_event_counts():
+    inputs = [([1, 1], [0, 2], {'epsilon': 1}), ([1, 1], [2, 0], {'epsilon': 1})]
+    search_spaces = [((0, 1), ((-float('inf'), 0.5), (-float('inf'), 1.5), (-float('inf'), 2.5))), ((0, 1, 2), )]
+    counts = [np.arange(12).reshape(6, 2)[:, ::-1], np.asarray([[5, 7], [9, 3], [0, 0]])]
+    event_counts = EventCounts(inputs, search_spaces, counts)
+    assert len(event_counts) == 9
+    assert event_counts.input_ids.tolist() == [0] * 6 + [1] * 3
+    assert event_counts.event_ids.tolist() == list(range(6)) + list(range(3))
+    # the counts are ordered as (larger, smaller)
+    assert event_counts.counts[:2].tolist() == [[1, 0], [3, 2]] and event_counts.counts[6:].tolist() == \
+        [[7, 5], [9, 3], [0, 0]]
+    # the events follow the order of the product of the search space, same as _count_events
+    for row, event in enumerate(itertools.product(*search_spaces[0])):
+        assert event_counts.pair(row) == inputs[0] + (event, )
+    assert event_counts.pair(7) == inputs[1] + ((1, ), )
+    assert len(EventCounts([], [], [])) == 0
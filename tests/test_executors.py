@@ -0,0 +1,152 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import concurrent.futures
+import multiprocessing as mp
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from statdp.algorithms import noisy_max_v1a_batched
+from statdp.executors import FuturesExecutor, WorkQueueExecutor, collect_array, is_local, share_array, shares_memory, \
+    start_workers
+from statdp.generators import generate_databases
+from statdp.hypotest import hypothesis_test
+from statdp.selectors import select_event
+
+
+def _check(executor):
+    D1 = [0] + [2 for _ in range(4)]
+    D2 = [1 for _ in range(5)]
+    # the executors give the same p-values as a single process with the same seed
+    expected = hypothesis_test(noisy_max_v1a_batched, D1, D2, {'epsilon': 0.5}, (0, ), 0.5, 50000, seed=0)
+    assert hypothesis_test(noisy_max_v1a_batched, D1, D2, {'epsilon': 0.5}, (0, ), 0.5, 50000, process_pool=executor,
+                           seed=0) == expected
+    input_list = generate_databases(noisy_max_v1a_batched, 5, {'epsilon': 0.5})
+    assert select_event(noisy_max_v1a_batched, input_list, 0.5, 10000, quiet=True, seed=0) == \
+        select_event(noisy_max_v1a_batched, input_list, 0.5, 10000, process_pool=executor, quiet=True, seed=0)
+
+
+def _fail(item):
+    raise KeyError(item)
+
+
+def _legacy_noisy_max(queries, epsilon):
+    return int(np.argmax(np.asarray(queries) + np.random.laplace(scale=2.0 / epsilon, size=len(queries))))
+
+
+def test_futures_executor():
+    with FuturesExecutor(processes=2) as executor:
+        assert executor.processes == 2
+        _check(executor)
+        assert sorted(executor.imap_unordered(abs, range(-10, 0))) == list(range(1, 11))
+    with FuturesExecutor(concurrent.futures.ThreadPoolExecutor(3)) as executor:
+        assert executor.processes == 3
+        _check(executor)
+        # the threads cannot share the legacy global random state
+        with pytest.raises(ValueError):
+            hypothesis_test(_legacy_noisy_max, [0, 2], [1, 1], {'epsilon': 0.5}, (0, ), 0.5, 1000,
+                            process_pool=executor)
+
+
+def test_work_queue_executor():
+    with WorkQueueExecutor() as executor:
+        workers = start_workers(executor.address, executor.authkey, processes=2)
+        _check(executor)
+        assert sorted(executor.imap_unordered(abs, range(-10, 0))) == list(range(1, 11))
+        # the exceptions in the workers are raised in the caller
+        with pytest.raises(KeyError):
+            list(executor.imap_unordered(_fail, range(3)))
+    for worker in workers:
+        worker.join(timeout=10)
+        assert not worker.is_alive()
+    # a random key is generated for each executor unless given
+    with WorkQueueExecutor() as executor, WorkQueueExecutor() as other:
+        assert len(executor.authkey) == 32 and executor.authkey != other.authkey
+    # the tasks are not waited for forever without workers
+    with WorkQueueExecutor(timeout=1) as executor:
+        with pytest.raises(TimeoutError):
+            list(executor.imap_unordered(abs, range(3)))
+
+
+def test_work_queue_terminate():
+    executor = WorkQueueExecutor(timeout=1)
+    workers = start_workers(executor.address, executor.authkey, processes=2)
+    errors = []
+
+    def consume():
+        try:
+            list(executor.imap_unordered(time.sleep, [2, 2, 60]))
+        except Exception as e:
+            errors.append(e)
+
+    # the two workers run a short task each and the long task is queued
+    consumer = threading.Thread(target=consume, daemon=True)
+    consumer.start()
+    deadline = time.monotonic() + 10
+    while executor.processes < 2 or executor._tasks.qsize() != 1:
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+    executor.terminate()
+    # the threads serving the workers are woken up and stopped, the workers stop after their running task
+    assert not any(thread.is_alive() for thread in executor._threads)
+    for worker in workers:
+        worker.join(timeout=10)
+        assert not worker.is_alive()
+    # the long task is dropped and the consumer is not left waiting
+    consumer.join(timeout=10)
+    assert not consumer.is_alive() and len(errors) == 1
+
+
+def test_worker_authkey():
+    # the key is only taken from the environment
+    environment = {key: value for key, value in os.environ.items() if key != 'STATDP_AUTHKEY'}
+    process = subprocess.run([sys.executable, '-m', 'statdp.worker', '127.0.0.1:1'], env=environment,
+                             stderr=subprocess.PIPE, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert process.returncode == 2 and b'STATDP_AUTHKEY' in process.stderr
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason='multiprocessing.shared_memory requires Python 3.8')
+def test_shared_array():
+    array = np.arange(20, dtype=np.int64).reshape(10, 2)
+    handle = share_array(array)
+    # only the name, shape and dtype are pickled
+    assert handle[1:] == ((10, 2), array.dtype.str)
+    assert np.array_equal(collect_array(handle), array)
+    if os.path.isdir('/dev/shm'):
+        assert not os.path.exists(os.path.join('/dev/shm', handle[0]))
+    # empty arrays can be shared as well
+    assert collect_array(share_array(np.zeros((0, 2)))).shape == (0, 2)
+    pool = mp.Pool(2)
+    try:
+        assert is_local(pool) and shares_memory(pool) and not is_local(None)
+        for handle in pool.imap_unordered(share_array, [array, array * 2]):
+            assert collect_array(handle).sum() in (array.sum(), 2 * array.sum())
+    finally:
+        pool.close()
+        pool.join()
+    with WorkQueueExecutor() as executor:
+        assert not is_local(executor)
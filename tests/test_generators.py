@@ -20,7 +20,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 from statdp.algorithms import noisy_max_v1a, histogram
-from statdp.generators import generate_arguments, generate_databases, ONE_DIFFER
+import numpy as np
+
+from statdp.generators import generate_arguments, generate_databases, stream_databases, ONE_DIFFER
 
 
 def test_generate_databases():
@@ -48,3 +50,30 @@ def test_generate_databases():
 def test_generate_arguments():
     d1, d2 = tuple(1 for _ in range(5)), tuple(2 for _ in range(5))
     assert generate_arguments(noisy_max_v1a, d1, d2, {}) is None
+
+
+def test_stream_databases():
+    stream = stream_databases(noisy_max_v1a, (5, 10), {'epsilon': 0.5}, candidates=20, seed=0)
+    input_list = list(stream)
+    assert len(input_list) == 40 and all(len(d1) == len(d2) == 5 for d1, d2, _ in input_list[:20])
+    # the fixed patterns come first, followed by neighbors with differences of at most one
+    assert [(d1.tolist(), d2.tolist(), args) for d1, d2, args in input_list[:8]] == \
+        list(generate_databases(noisy_max_v1a, 5, {'epsilon': 0.5}))
+    assert all(np.abs(d1 - d2).max() <= 1 for d1, d2, _ in input_list)
+
+    # every other pair after a sent input (the 5th, 7th, ... here) is its neighbor
+    stream = stream_databases(histogram, 1000, {'epsilon': 0.5}, sensitivity=ONE_DIFFER, candidates=10, seed=0)
+    for _ in range(4):
+        center = next(stream)
+    d1, d2, _ = stream.send(center)
+    assert np.count_nonzero(d1 != d2) == 1 and 1 <= np.count_nonzero(d1 != center[0]) <= 100
+    assert all(np.count_nonzero(d1 != d2) == 1 for d1, d2, _ in stream)
+
+    # the center only applies to the inputs of its own length
+    stream = stream_databases(histogram, (5, 10), {'epsilon': 0.5}, candidates=12, seed=0)
+    center = next(stream)
+    input_list = [stream.send(center)] + list(stream)
+    assert [len(d1) for d1, _, _ in input_list] == [5] * 11 + [10] * 12
+    # the randomized pairs always differ, even for a single query
+    stream = stream_databases(histogram, 1, {'epsilon': 0.5}, candidates=50, seed=0)
+    assert all(np.any(d1 != d2) for d1, d2, _ in stream)
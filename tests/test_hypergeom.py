@@ -0,0 +1,97 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from scipy.stats import hypergeom
+
+from statdp import _hypergeom
+from statdp._hypergeom import sf_many, TailCache, tail_cache
+
+
+def test_sf_many():
+    # queries on a line N - k = constant, as in test_statistics
+    for iterations, cx, cy in ((100000, 30000, 20000), (100000, 21000, 20000), (1000, 30, 20), (1000, 300, 0)):
+        ks = np.random.binomial(cx, 0.7, 200)
+        expected = hypergeom.sf(ks - 1, 2 * iterations, iterations, ks + cy)
+        assert np.allclose(sf_many(ks - 1, 2 * iterations, iterations, ks + cy), expected, rtol=1e-8, atol=1e-300)
+
+    # queries with the same N
+    ks = np.arange(-5, 120)
+    expected = hypergeom.sf(ks, 1000, 300, 100)
+    assert np.allclose(sf_many(ks, 1000, 300, 100), expected, rtol=1e-8, atol=1e-300)
+    assert sf_many(ks, 1000, 300, 100).shape == ks.shape
+
+    # edge cases
+    assert np.allclose(sf_many([-1, 0, 5, 10], 20, 10, 5), [1.0, hypergeom.sf(0, 20, 10, 5), 0.0, 0.0])
+    assert sf_many([], 20, 10, 5).shape == (0, )
+
+
+def test_tail_cache():
+    tail_cache.clear()
+    # the same line N - k is answered from the cached table
+    for _ in range(10):
+        ks = np.random.binomial(3000, 0.5, 200)
+        sf_many(ks - 1, 20000, 10000, ks + 2000)
+    info = tail_cache.info()
+    assert info['misses'] == 2 and info['hits'] == 9 and info['tables'] == 2
+
+    # least recently used tables are evicted when the memory cap is exceeded
+    cache = TailCache(maxbytes=130)
+    cache.get(1, lambda: (0, np.zeros(10)))
+    cache.get(2, lambda: (0, np.zeros(5)))
+    cache.get(1, lambda: (0, np.zeros(10)))
+    cache.get(3, lambda: (0, np.zeros(5)))
+    assert cache.info() == {'hits': 1, 'misses': 3, 'tables': 2, 'nbytes': 120, 'maxbytes': 130}
+    cache.get(1, lambda: (0, np.zeros(10)))
+    assert cache.info()['hits'] == 2
+    cache.resize(80)
+    assert cache.info()['tables'] == 1 and cache.nbytes == 80
+
+
+def test_lazy_backend(tmp_path, monkeypatch):
+    # importing statdp does not load the heavy modules or discover GSL
+    code = 'import sys, statdp, statdp._hypergeom as h; ' \
+           'print(sorted(m for m in ("scipy", "tqdm", "multiprocessing", "subprocess") if m in sys.modules), ' \
+           'h._backend is None)'
+    output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert output.stdout.decode().strip() == '[] True'
+
+    cache_file = str(tmp_path / 'statdp' / 'gsl.json')
+    monkeypatch.setattr(_hypergeom, '_CACHE_FILE', cache_file)
+    monkeypatch.setattr(_hypergeom, '_backend', None)
+    use_gsl = _hypergeom.uses_gsl()
+    assert np.isclose(_hypergeom.get_cdf()(3, 20, 7, 12), hypergeom.cdf(3, 20, 7, 12))
+    assert np.isclose(_hypergeom.cdf(3, 20, 7, 12), hypergeom.cdf(3, 20, 7, 12))
+    with open(cache_file) as f:
+        lib_path = json.load(f)['lib_path']
+    assert (lib_path is not None) == use_gsl
+    # the cached path is used without calling gsl-config again
+    monkeypatch.setattr(_hypergeom, '_find_gsl', lambda: pytest.fail('GSL discovered again'))
+    if lib_path is None:
+        monkeypatch.setattr(_hypergeom.shutil, 'which', lambda name: None)
+    assert _hypergeom._gsl_path() == lib_path
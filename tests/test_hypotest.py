@@ -19,8 +19,11 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from statdp.algorithms import noisy_max_v1a
-from statdp.hypotest import hypothesis_test
+import pytest
+
+from statdp.algorithms import noisy_max_v1a, noisy_max_v1a_batched
+from statdp.hypotest import hypothesis_test, hypothesis_tests
+from statdp.hypotest import test_statistics as p_value
 
 
 def test_core_single():
@@ -54,3 +57,73 @@ def test_core_multi():
     p1, p2 = hypothesis_test(noisy_max_v1a, D1, D2, {'epsilon': 0.5}, event, 0.75, 100000, process_pool=pool)
     assert 0.95 <= p1 <= 1.0
     assert 0.95 <= p2 <= 1.0
+
+
+def test_core_batched():
+    D1 = [0] + [2 for _ in range(4)]
+    D2 = [1 for _ in range(5)]
+    event = (0,)
+    p1, p2 = hypothesis_test(noisy_max_v1a_batched, D1, D2, {'epsilon': 0.5}, event, 0.25, 100000)
+    assert 0 <= p1 <= 0.05
+    assert 0.95 <= p2 <= 1.0
+    p1, p2 = hypothesis_test(noisy_max_v1a_batched, D1, D2, {'epsilon': 0.5}, event, 0.75, 100000)
+    assert 0.95 <= p1 <= 1.0
+    assert 0.95 <= p2 <= 1.0
+
+
+def test_core_sequential():
+    D1 = [0] + [2 for _ in range(4)]
+    D2 = [1 for _ in range(5)]
+    event = (0,)
+    # clearly decided results stop early
+    (p1, p2), iterations = hypothesis_test(noisy_max_v1a_batched, D1, D2, {'epsilon': 0.5}, event, 0.25, 500000,
+                                           sequential=True)
+    assert 0 <= p1 <= 0.05 and 0.95 <= p2 <= 1.0 and iterations < 500000
+    p1, iterations = hypothesis_test(noisy_max_v1a_batched, D1, D2, {'epsilon': 0.5}, event, 1.5, 500000,
+                                     report_p2=False, sequential=True)
+    assert 0.95 <= p1 <= 1.0 and iterations < 500000
+
+
+def test_core_sweep():
+    D1 = [0] + [2 for _ in range(4)]
+    D2 = [1 for _ in range(5)]
+    p_values = hypothesis_tests(noisy_max_v1a_batched, [(D1, D2, {'epsilon': 0.5}, (0, ))] * 2 +
+                                [(D1, D2, {'epsilon': 0.5}, (1, ))], (0.25, 0.75, 0.25), 100000)
+    assert 0 <= p_values[0] <= 0.05
+    assert 0.95 <= p_values[1] <= 1.0
+    assert 0.95 <= p_values[2] <= 1.0
+
+
+def test_core_seed():
+    import multiprocessing as mp
+    from statdp import Session
+    D1 = [0] + [2 for _ in range(4)]
+    D2 = [1 for _ in range(5)]
+    event = (0,)
+    # the same seed gives the same p-values regardless of the number of processes
+    expected = hypothesis_test(noisy_max_v1a_batched, D1, D2, {'epsilon': 0.5}, event, 0.5, 50000, seed=42)
+    pool = mp.Pool(2)
+    try:
+        assert hypothesis_test(noisy_max_v1a_batched, D1, D2, {'epsilon': 0.5}, event, 0.5, 50000,
+                               process_pool=pool, seed=42) == expected
+    finally:
+        pool.close()
+        pool.join()
+    with Session(3) as session:
+        assert hypothesis_test(noisy_max_v1a_batched, D1, D2, {'epsilon': 0.5}, event, 0.5, 50000,
+                               process_pool=session, seed=42) == expected
+    assert hypothesis_test(noisy_max_v1a_batched, D1, D2, {'epsilon': 0.5}, event, 0.5, 50000, seed=43) != expected
+
+
+def test_statistics_exact():
+    # the exact p-value is deterministic and agrees with the average of the sampled p-values
+    for cx, cy, epsilon in ((5000, 3000, 0.5), (300, 250, 0.2), (10, 3, 0)):
+        exact = p_value(cx, cy, epsilon, 100000)
+        assert exact == p_value(cx, cy, epsilon, 100000)
+        sampled = [p_value(cx, cy, epsilon, 100000, seed=seed, exact=False) for seed in range(20)]
+        assert abs(exact - sum(sampled) / len(sampled)) < 0.01
+    assert p_value(0, 0, 1, 100000) == 1.0
+    assert 0 <= p_value(100000, 30000, 1.0, 100000) < 1e-100
+    # the process pool is no longer used
+    with pytest.warns(DeprecationWarning):
+        assert p_value(5000, 3000, 0.5, 100000, object()) == p_value(5000, 3000, 0.5, 100000)
@@ -0,0 +1,90 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import multiprocessing as mp
+
+from statdp import ExecutionOptions, detect_counterexample
+from statdp.algorithms import noisy_max_v1a_batched
+from statdp.core import run_algorithm
+from statdp.generators import generate_databases
+from statdp.profiler import Profiler, active, phase, profiling
+from statdp.selectors import select_event
+
+
+def test_profiler():
+    # no-op without an active profiler
+    with phase('sampling'):
+        assert active() is None
+    records = []
+    profiler = Profiler(callback=lambda *record: records.append(record))
+    with profiling(profiler):
+        assert active() is profiler
+        with phase('sampling'):
+            pass
+        with phase('sampling'):
+            pass
+    assert active() is None
+    assert profiler.phases['sampling']['count'] == 2 and [name for name, *_ in records] == ['sampling'] * 2
+    other = Profiler()
+    other.record('counting', 1.0, 0.5)
+    other.calls, other.bytes_sent = 10, 100
+    profiler.merge(other)
+    totals = profiler.totals()
+    assert totals['phases']['counting'] == {'wall': 1.0, 'cpu': 0.5, 'count': 1}
+    assert totals['calls'] == 10 and totals['bytes_sent'] == 100 and totals['bytes_received'] == 0
+
+
+def test_profiling():
+    profiler = Profiler()
+    run_algorithm(noisy_max_v1a_batched, [0, 2], [1, 1], {'epsilon': 1}, None, 10000, profiler=profiler)
+    totals = profiler.totals()
+    assert set(totals['phases']) == {'sampling', 'search space', 'counting'}
+    assert totals['calls'] == 20000 and totals['calls_per_second'] > 0 and totals['bytes_sent'] == 0
+
+    # the phases in the workers are merged back along with the bytes sent over the pool
+    profiler = Profiler(measure_bytes=True)
+    input_list = generate_databases(noisy_max_v1a_batched, 5, {'epsilon': 1})
+    pool = mp.Pool(2)
+    try:
+        select_event(noisy_max_v1a_batched, input_list, 1, 10000, process_pool=pool, quiet=True, profiler=profiler)
+    finally:
+        pool.close()
+        pool.join()
+    totals = profiler.totals()
+    assert {'sampling', 'search space', 'counting', 'pool', 'p-value'} <= set(totals['phases'])
+    # the algorithm runs once on each distinct database
+    assert totals['calls'] == 10000 * len({tuple(database) for d1, d2, _ in input_list for database in (d1, d2)})
+    # the samples stay in the workers, only the inputs and the counts are sent over the pool
+    assert 0 < totals['bytes_sent'] < 10000 and 0 < totals['bytes_received'] < 10000
+    # the bytes are only measured on request
+    profiler = Profiler()
+    with mp.Pool(2) as pool:
+        select_event(noisy_max_v1a_batched, input_list, 1, 10000, process_pool=pool, quiet=True, profiler=profiler)
+    totals = profiler.totals()
+    assert 'pool' in totals['phases'] and totals['bytes_sent'] == totals['bytes_received'] == 0
+
+    # the totals of each test epsilon are attached to its result
+    profiler = Profiler()
+    result = detect_counterexample(noisy_max_v1a_batched, (0.5, 1.5), {'epsilon': 1}, num_input=5,
+                                   event_iterations=10000, detect_iterations=10000, cores=1, quiet=True,
+                                   execution=ExecutionOptions(profiler=profiler))
+    assert all(len(entry) == 7 for entry in result)
+    assert sum(entry[6]['calls'] for entry in result) == profiler.totals()['calls']
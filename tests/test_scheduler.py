@@ -0,0 +1,60 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import multiprocessing as mp
+
+from statdp.scheduler import ChunkScheduler, pool_size
+
+
+def _chunk(start, iterations):
+    return start, iterations
+
+
+def test_chunks():
+    scheduler = ChunkScheduler(4, oversubscription=4, target_seconds=1.0, probe_iterations=1000)
+    probe_chunks = scheduler.probe_chunks(500000)
+    assert probe_chunks == [1000] * 4
+    # limited by the oversubscription
+    chunks = scheduler.chunks(496000, 1e-7)
+    assert sum(chunks) == 496000 and len(chunks) == 16
+    # limited by the time each chunk takes
+    chunks = scheduler.chunks(496000, 1e-4)
+    assert sum(chunks) == 496000 and max(chunks) == 10000
+    # small iterations
+    assert sum(scheduler.probe_chunks(10)) == 4 and sum(scheduler.chunks(6, 1e-4)) == 6
+    assert sum(ChunkScheduler(8).probe_chunks(3)) == 3
+
+
+def test_run():
+    pool = mp.Pool(3)
+    try:
+        assert pool_size(pool) == 3
+        scheduler = ChunkScheduler(pool_size(pool))
+        chunks = sorted(scheduler.run(pool, _chunk, 100003, granularity=1000, start=500))
+        # the chunks cover the iterations from the start without gaps, and start at multiples of the granularity
+        assert sum(iterations for _, iterations in chunks) == 100003
+        assert all(start + iterations == next_start for (start, iterations), (next_start, _) in zip(chunks, chunks[1:]))
+        assert chunks[0][0] == 500 and all((start - 500) % 1000 == 0 for start, _ in chunks)
+        throughput = scheduler.throughput()
+        assert 1 <= len(throughput) <= 3 and all(value > 0 for value in throughput.values())
+    finally:
+        pool.close()
+        pool.join()
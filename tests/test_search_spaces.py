@@ -0,0 +1,74 @@
+# MIT License
+#
+# Copyright (c) 2018 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import functools
+
+import numpy as np
+
+from statdp.algorithms import histogram_batched
+from statdp.core import run_algorithm
+from statdp.search_spaces import densest, intervals, log_tails, quantiles, strategy_name
+
+
+def _densest_with_loop(values):
+    # the original search for the densest 70% range
+    search_range = int(0.7 * len(values))
+    search_max = min(range(search_range, len(values)), key=lambda x: values[x] - values[x - search_range])
+    search_min = search_max - search_range
+    return tuple((-float('inf'), float(alpha)) for alpha in
+                 np.linspace(values[search_min], values[search_max], num=10))
+
+
+def test_densest():
+    rng = np.random.default_rng(0)
+    for values in (rng.laplace(size=10000), rng.exponential(size=1001), np.arange(5.0)):
+        values.sort()
+        assert densest(values) == _densest_with_loop(values)
+
+
+def test_strategies():
+    values = np.sort(np.random.default_rng(0).normal(size=100000))
+    events = quantiles(values)
+    assert len(events) == 10 and all(low == -float('inf') for low, _ in events)
+    assert abs(events[0][1] - np.quantile(values, 0.05)) < 1e-9
+    events = intervals(values)
+    assert len(events) == 15 and all(low < high for low, high in events)
+    events = log_tails(values, num=4)
+    assert len(events) == 8
+    assert events[0] == (-float('inf'), float(np.quantile(values, 1e-3)))
+    assert events[4] == (float(np.quantile(values, 0.5)), float('inf'))
+    assert events[-1] == (float(np.quantile(values, 1 - 1e-3)), float('inf'))
+    # duplicated thresholds of discrete results are removed
+    assert len(quantiles(np.sort(np.repeat(np.arange(3.0), 100)))) == 3
+
+
+def test_run_algorithm_strategy():
+    d1, d2, kwargs = [2] + [1] * 4, [1] * 5, {'epsilon': 1}
+    counts, input_event_pairs = run_algorithm(histogram_batched, d1, d2, kwargs, None, 10000, seed=0,
+                                              search_space=intervals)
+    assert len(counts) == 15 and all(len(event) == 1 and len(event[0]) == 2 for *_, event in input_event_pairs)
+    # the intervals between adjacent endpoints (the first and the last event) hold 18% of the 20000 results
+    assert all(3500 <= cx + cy <= 3700 for cx, cy in (counts[0], counts[-1]))
+
+
+def test_strategy_name():
+    assert strategy_name(quantiles) == 'statdp.search_spaces.quantiles'
+    assert strategy_name(functools.partial(log_tails, num=3)) == 'statdp.search_spaces.log_tails(num=3)'
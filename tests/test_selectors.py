@@ -19,8 +19,17 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from statdp.algorithms import noisy_max_v1a, noisy_max_v1b
-from statdp.selectors import select_event
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from statdp import Profiler
+from statdp.algorithms import noisy_max_v1a, noisy_max_v1a_batched, noisy_max_v1b
+from statdp.core import batched
+from statdp.generators import generate_databases, stream_databases
+from statdp.selectors import _groups, select_event, select_events
 
 
 def test_select_event():
@@ -32,3 +41,103 @@ def test_select_event():
     assert event == (0, )
     _, _, _, event = select_event(noisy_max_v1b, ((d1, d2, {'epsilon': 0.5}),), 0.5, 100000, process_pool=pool)
     assert event[0][0] < 0 < event[0][1]
+
+
+def test_select_events():
+    d1 = [0] + [2 for _ in range(4)]
+    d2 = [1 for _ in range(5)]
+    results = select_events(noisy_max_v1a, ((d1, d2, {'epsilon': 0.5}),), (0.25, 0.5, 0.75), 100000)
+    assert len(results) == 3 and all(event == (0, ) for _, _, _, event in results)
+
+
+def test_select_event_adaptive():
+    input_list = generate_databases(noisy_max_v1a_batched, 5, {'epsilon': 0.5})
+    exhaustive, adaptive = Profiler(), Profiler()
+    expected = select_event(noisy_max_v1a_batched, input_list, 0.5, 50000, quiet=True, seed=0, profiler=exhaustive)
+    # the screening keeps the selected input, whose event is then the same as without screening
+    assert select_event(noisy_max_v1a_batched, input_list, 0.5, 50000, quiet=True, seed=0, profiler=adaptive,
+                        adaptive=True) == expected
+    assert adaptive.calls < 0.6 * exhaustive.calls
+
+
+def test_select_event_batches():
+    input_list = generate_databases(noisy_max_v1a_batched, 5, {'epsilon': 0.5})
+    expected = select_event(noisy_max_v1a_batched, input_list, 0.5, 20000, quiet=True, seed=0)
+    assert select_event(noisy_max_v1a_batched, input_list, 0.5, 20000, quiet=True, seed=0, batch_size=3) == expected
+    stream = stream_databases(noisy_max_v1a_batched, 5, {'epsilon': 0.5}, candidates=12, seed=0)
+    d1, d2, _, event = select_event(noisy_max_v1a_batched, stream, 0.5, 20000, quiet=True, seed=0, batch_size=4)
+    assert len(d1) == len(d2) == 5 and len(event) == 1
+
+
+def test_select_event_distinct_databases():
+    d1, d2, kwargs = [0] + [2 for _ in range(4)], [1 for _ in range(5)], {'epsilon': 0.5}
+    single, repeated = Profiler(), Profiler()
+    expected = select_event(noisy_max_v1a_batched, [(d1, d2, kwargs)], 0.5, 10000, quiet=True, seed=0,
+                            profiler=single)
+    # the repeated input and the reversed input (of the same databases as numpy arrays) share the samples
+    input_list = [(d1, d2, kwargs), (d1, d2, kwargs), (np.asarray(d2), np.asarray(d1), kwargs)]
+    assert select_event(noisy_max_v1a_batched, input_list, 0.5, 10000, quiet=True, seed=0,
+                        profiler=repeated) == expected
+    assert single.calls == repeated.calls == 20000
+
+
+def test_groups():
+    keys = [((1, 0), (2, 0)), ((1, 0), (3, 0)), ((4, 0), (1, 0)), ((1, 0), (5, 0)), ((1, 0), (2, 0))]
+    assert _groups(keys, 1) == [[0, 1, 2, 3, 4]]
+    assert _groups(keys, 2) == [[0, 1, 3, 4], [2]]
+    # the largest group is split while there are fewer groups than processes
+    assert _groups(keys, 3) == [[0, 1], [3, 4], [2]]
+    assert sorted(map(len, _groups(keys, 8))) == [1] * 5
+    assert _groups([], 4) == []
+
+
+def test_select_event_split_calls():
+    import multiprocessing as mp
+    d1, kwargs = [0] + [2 for _ in range(4)], {'epsilon': 0.5}
+    input_list = [(d1, [1 for _ in range(5)], kwargs), (d1, [3 for _ in range(5)], kwargs),
+                  (d1, [2, 2, 2, 2, 1], kwargs), (d1, [0, 0, 0, 0, 0], kwargs)]
+    calls = []
+    for processes in (1, 2, 4):
+        profiler = Profiler()
+        with mp.Pool(processes) as pool:
+            select_event(noisy_max_v1a_batched, input_list, 0.5, 10000, process_pool=pool, quiet=True, seed=0,
+                         profiler=profiler)
+        calls.append(profiler.calls)
+    # the one group of d1 is split for more processes than d1 groups, and each split group samples the d1 again
+    assert calls == [50000, 60000, 80000]
+
+
+def test_select_event_spill(tmp_path):
+    import multiprocessing as mp
+    input_list = generate_databases(noisy_max_v1a_batched, 5, {'epsilon': 0.5})
+    expected = select_event(noisy_max_v1a_batched, input_list, 0.5, 20000, quiet=True, seed=0)
+    assert select_event(noisy_max_v1a_batched, input_list, 0.5, 20000, quiet=True, seed=0,
+                        spill_dir=str(tmp_path)) == expected
+    # the workers write the samples to the directory and count them from there
+    with mp.Pool(2) as pool:
+        assert select_event(noisy_max_v1a_batched, input_list, 0.5, 20000, process_pool=pool, quiet=True, seed=0,
+                            spill_dir=str(tmp_path)) == expected
+    assert os.listdir(str(tmp_path)) == []
+
+
+@batched
+def _fail_on_x_shape(queries, epsilon, size, rng=None):
+    if queries[0] == 1 and queries[-1] == 0:
+        raise ValueError('x shape')
+    return noisy_max_v1a_batched(queries, epsilon, size, rng=rng)
+
+
+@pytest.mark.skipif(not os.path.isdir('/dev/shm') or sys.version_info < (3, 8), reason='requires /dev/shm')
+def test_select_event_failure():
+    import multiprocessing as mp
+    input_list = generate_databases(noisy_max_v1a_batched, 5, {'epsilon': 0.5})
+    blocks = set(os.listdir('/dev/shm'))
+    pool = mp.Pool(2)
+    try:
+        # the group of the x shape input fails right away, the counts of the other group are still collected and freed
+        with pytest.raises(ValueError):
+            select_event(_fail_on_x_shape, input_list, 0.5, 10000, process_pool=pool, quiet=True, seed=0)
+    finally:
+        pool.close()
+        pool.join()
+    assert set(os.listdir('/dev/shm')) <= blocks
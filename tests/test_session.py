@@ -0,0 +1,67 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import threading
+
+from statdp import ExecutionOptions, Session, detect_counterexample
+from statdp.algorithms import noisy_max_v1a_batched
+from statdp.hypotest import hypothesis_test
+
+
+def test_session():
+    with Session(2) as session:
+        D1 = [0] + [2 for _ in range(4)]
+        D2 = [1 for _ in range(5)]
+        p1, p2 = hypothesis_test(noisy_max_v1a_batched, D1, D2, {'epsilon': 0.5}, (0, ), 0.25, 100000,
+                                 process_pool=session)
+        assert 0 <= p1 <= 0.05 and 0.95 <= p2 <= 1.0
+        stats = session.stats()
+        assert stats['processes'] == 2 and stats['dispatched'] == stats['completed'] > 0
+        assert 0 <= stats['utilization'] <= 1 and sum(stats['throughput'].values()) > 0
+
+        # the session stays open across detections
+        for _ in range(2):
+            result = detect_counterexample(noisy_max_v1a_batched, 0.25, {'epsilon': 0.5}, num_input=5,
+                                           event_iterations=10000, detect_iterations=10000, quiet=True,
+                                           execution=ExecutionOptions(session=session))
+            assert len(result) == 1
+        assert session.stats()['completed'] > stats['completed']
+
+
+def test_session_stats_threads():
+    # the statistics read from another thread while the tasks run are consistent
+    snapshots, done = [], threading.Event()
+
+    def watch(session):
+        while not done.is_set():
+            snapshots.append(session.stats())
+
+    with Session(2) as session:
+        watcher = threading.Thread(target=watch, args=(session, ))
+        watcher.start()
+        try:
+            assert sorted(session.imap_unordered(abs, range(-500, 0))) == list(range(1, 501))
+        finally:
+            done.set()
+            watcher.join()
+        assert session.stats()['dispatched'] == session.stats()['completed'] == 500
+    assert all(stats['completed'] <= stats['dispatched'] <= 500 and 0 <= stats['utilization'] <= 1
+               for stats in snapshots)
@@ -0,0 +1,86 @@
+# MIT License
+#
+# Copyright (c) 2019 Yuxin Wang
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from statdp import ExecutionOptions, detect_counterexample
+from statdp.algorithms import noisy_max_v1a, noisy_max_v1a_batched
+from statdp.store import ResultStore, result_key
+
+
+def test_store(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    key = result_key(noisy_max_v1a, 0.5, kwargs={'epsilon': 0.5}, detect_iterations=1000)
+    assert key != result_key(noisy_max_v1a, 0.6, kwargs={'epsilon': 0.5}, detect_iterations=1000)
+    assert key != result_key(noisy_max_v1a_batched, 0.5, kwargs={'epsilon': 0.5}, detect_iterations=1000)
+    assert key != result_key(noisy_max_v1a, 0.5, kwargs={'epsilon': 0.7}, detect_iterations=1000)
+    store = ResultStore(path)
+    assert len(store) == 0 and store.get(key) is None
+    store.put(key, (0.5, 0.25, [1, 1], [0, 2], {'epsilon': 0.5}, (0, )))
+    assert key in store
+    # simulate a crash in the middle of writing a line
+    with open(path, 'a') as f:
+        f.write('{"key": "partial", "res')
+    store = ResultStore(path)
+    assert len(store) == 1 and store.get(key) == (0.5, 0.25, [1, 1], [0, 2], {'epsilon': 0.5}, (0, ))
+    # the next result is written on a new line after the partial one
+    other_key = result_key(noisy_max_v1a, 0.7, kwargs={'epsilon': 0.5}, detect_iterations=1000)
+    store.put(other_key, (0.7, 0.5, [1, 1], [0, 2], {'epsilon': 0.5}, (float('inf'), )))
+    store = ResultStore(path)
+    assert len(store) == 2 and store.get(other_key)[5] == (float('inf'), )
+
+
+def test_resume(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    arguments = dict(num_input=5, event_iterations=10000, detect_iterations=10000, cores=1, quiet=True, seed=0)
+    result = detect_counterexample(noisy_max_v1a_batched, (0.4, 0.6), {'epsilon': 0.5},
+                                   execution=ExecutionOptions(store=path), **arguments)
+    with open(path) as f:
+        assert len(f.readlines()) == 2
+    # stored results are reused, only the new epsilon is detected and written
+    resumed = detect_counterexample(noisy_max_v1a_batched, (0.4, 0.6, 0.8), {'epsilon': 0.5},
+                                    execution=ExecutionOptions(store=path), **arguments)
+    with open(path) as f:
+        assert len(f.readlines()) == 3
+    assert [(epsilon, p, tuple(event)) for epsilon, p, _, _, _, event in resumed[:2]] == \
+        [(epsilon, p, tuple(event)) for epsilon, p, _, _, _, event in result]
+    # the results do not depend on the positions of the epsilons, so the stored results match a fresh run
+    reordered = detect_counterexample(noisy_max_v1a_batched, (0.8, 0.6), {'epsilon': 0.5}, **arguments)
+    assert [(epsilon, p, tuple(event)) for epsilon, p, _, _, _, event in reordered] == \
+        [(epsilon, p, tuple(event)) for epsilon, p, _, _, _, event in resumed[:0:-1]]
+    # the results of different settings are not mixed up
+    detect_counterexample(noisy_max_v1a_batched, (0.4, ), {'epsilon': 0.7},
+                          execution=ExecutionOptions(store=ResultStore(path)), **arguments)
+    assert len(ResultStore(path)) == 4
+
+
+def test_resume_sequential(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    arguments = dict(num_input=5, event_iterations=10000, detect_iterations=10000, cores=1, quiet=True, seed=0,
+                     sequential=True)
+    result = detect_counterexample(noisy_max_v1a_batched, (0.4, ), {'epsilon': 0.5},
+                                   execution=ExecutionOptions(store=path), **arguments)
+    assert len(result[0]) == 7 and 0 < result[0][6] <= 10000
+    # the iterations of the sequential test are stored along with the result
+    resumed = detect_counterexample(noisy_max_v1a_batched, (0.4, ), {'epsilon': 0.5},
+                                   execution=ExecutionOptions(store=path), **arguments)
+    with open(path) as f:
+        assert len(f.readlines()) == 1
+    assert [(epsilon, p, tuple(event), iterations) for epsilon, p, _, _, _, event, iterations in resumed] == \
+        [(epsilon, p, tuple(event), iterations) for epsilon, p, _, _, _, event, iterations in result]